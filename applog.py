@@ -0,0 +1,18 @@
+# Shared debug logger for streamlit_app.py and its helper modules.
+import contextvars
+import os
+import time
+
+# AVATHARAM_DEBUG=0 silences debug(); benchmarks also flip this at runtime.
+DEBUG = os.getenv("AVATHARAM_DEBUG", "1") != "0"
+
+# Per-visitor correlation id, set at the top of each script run (and by
+# background workers for the session they serve).
+correlation_id: contextvars.ContextVar = contextvars.ContextVar("correlation_id", default=None)
+
+
+def debug(msg: str):
+    if DEBUG:
+        cid = correlation_id.get()
+        prefix = f"[{cid}] " if cid else ""
+        print(f"[{time.strftime('%H:%M:%S')}] {prefix}{msg}", flush=True)
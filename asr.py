@@ -0,0 +1,498 @@
+# Local speech recognition for Avatharam.
+#
+# Models are loaded once per process and shared by every Streamlit session.
+# Streamlit re-executes streamlit_app.py on every rerun, but imported modules
+# stay in sys.modules, so the registry below survives reruns and sessions.
+#
+# Environment:
+#   WHISPER_MODEL          faster-whisper size            (default "tiny")
+#   WHISPER_DEVICE         faster-whisper device          (default "auto")
+#   WHISPER_COMPUTE_TYPE   faster-whisper compute type    (default "int8")
+#   ASR_TUNE_*             calibrated defaults for the above, see asr_tune.py
+#   VOSK_MODEL_PATH        Vosk model directory (fallback engine)
+#   ASR_MAX_MODELS         max models kept resident       (default 2)
+#   ASR_MODEL_IDLE_SECS    evict a model unused this long (default 900, 0 = never)
+#   ASR_WARMUP             "1" to load + run models once at start-up
+#   ASR_CACHE_ENTRIES      transcripts kept in memory         (default 256, 0 = off)
+#   ASR_CACHE_DIR          directory for the on-disk transcript tier (off if unset)
+#   ASR_CACHE_MAX_MB       size limit of the on-disk tier     (default 64)
+#   ASR_WORKERS            concurrent recognitions            (default min(4, cores))
+#   WHISPER_CPU_THREADS    threads per recognition            (default cores / ASR_WORKERS)
+#   ASR_QUEUE_MAX          requests allowed to wait for a worker (default 8)
+#   ASR_TIMEOUT            seconds a caller waits for a result (default 60)
+#   ASR_VAD / VAD_*        silence trimming and splitting, see vad.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+
+import capabilities
+from applog import debug
+from asr_tune import load_choice
+from audio import SAMPLE_RATE, decode_audio, pcm_to_s16le
+from cache import DiskCache, LRUCache, TieredCache, content_key
+from tracing import count, observe, run_in_context, span
+from vad import ASR_VAD
+from vad import split as vad_split
+
+# A choice saved by `python asr_tune.py` on this host replaces the defaults;
+# explicit variables still win.
+_TUNED = load_choice()
+WHISPER_MODEL = os.getenv("WHISPER_MODEL") or _TUNED.get("model") or "tiny"
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "auto")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE") or _TUNED.get("compute_type") or "int8"
+ASR_MAX_MODELS = max(1, int(os.getenv("ASR_MAX_MODELS", "2")))
+ASR_MODEL_IDLE_SECS = float(os.getenv("ASR_MODEL_IDLE_SECS", "900"))
+ASR_CACHE_ENTRIES = int(os.getenv("ASR_CACHE_ENTRIES", "256"))
+ASR_CACHE_DIR = os.getenv("ASR_CACHE_DIR")
+ASR_CACHE_MAX_MB = float(os.getenv("ASR_CACHE_MAX_MB", "64"))
+_CORES = os.cpu_count() or 1
+ASR_WORKERS = max(1, int(os.getenv("ASR_WORKERS") or _TUNED.get("num_workers") or min(4, _CORES)))
+WHISPER_CPU_THREADS = max(1, int(os.getenv("WHISPER_CPU_THREADS") or _TUNED.get("cpu_threads")
+                                 or max(1, _CORES // ASR_WORKERS)))
+ASR_QUEUE_MAX = max(0, int(os.getenv("ASR_QUEUE_MAX", "8")))
+ASR_TIMEOUT = float(os.getenv("ASR_TIMEOUT", "60"))
+
+
+# ---------------- Model registry ----------------
+class _Entry:
+    __slots__ = ("model", "last_used", "loaded_at", "load_secs")
+
+    def __init__(self, model, load_secs: float):
+        self.model = model
+        self.loaded_at = self.last_used = time.monotonic()
+        self.load_secs = load_secs
+
+
+_models: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+_models_lock = threading.Lock()
+_load_locks: dict = {}
+_reaper: Optional[threading.Thread] = None
+
+
+def _evict_locked(now: float):
+    if ASR_MODEL_IDLE_SECS > 0:
+        for key in [k for k, e in _models.items() if now - e.last_used > ASR_MODEL_IDLE_SECS]:
+            _models.pop(key)
+            debug(f"[asr] evicted idle model {key}")
+    while len(_models) > ASR_MAX_MODELS:
+        key, _ = _models.popitem(last=False)
+        debug(f"[asr] evicted LRU model {key}")
+
+
+def _reap_loop():
+    # Frees idle models while nobody is transcribing; _get_model only sees
+    # the registry when a request arrives.
+    while True:
+        time.sleep(max(0.05, min(30.0, ASR_MODEL_IDLE_SECS / 4)))
+        evict_idle()
+
+
+def _start_reaper_locked():
+    global _reaper
+    if _reaper is None and ASR_MODEL_IDLE_SECS > 0:
+        _reaper = threading.Thread(target=_reap_loop, name="asr-reaper", daemon=True)
+        _reaper.start()
+
+
+def _get_model(key: Hashable, loader: Callable[[], object]):
+    with _models_lock:
+        now = time.monotonic()
+        entry = _models.get(key)
+        if entry is not None:
+            # Bump before evicting, so the model asked for is never the one dropped.
+            entry.last_used = now
+            _models.move_to_end(key)
+            _evict_locked(now)
+            return entry.model
+        _evict_locked(now)
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # Load outside the registry lock so other variants stay available; the
+    # per-key lock makes concurrent sessions wait for a single load.
+    with load_lock:
+        with _models_lock:
+            entry = _models.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                _models.move_to_end(key)
+                return entry.model
+        t0 = time.monotonic()
+        model = loader()
+        load_secs = time.monotonic() - t0
+        observe("asr_model_load", load_secs, model=str(key))
+        with _models_lock:
+            _models[key] = _Entry(model, load_secs)
+            _models.move_to_end(key)
+            _evict_locked(time.monotonic())
+            _start_reaper_locked()
+        debug(f"[asr] loaded {key} in {load_secs:.2f}s")
+        return model
+
+
+def get_whisper_model(size: Optional[str] = None, device: Optional[str] = None, compute_type: Optional[str] = None,
+                      cpu_threads: Optional[int] = None, num_workers: Optional[int] = None):
+    size = size or WHISPER_MODEL
+    device = device or WHISPER_DEVICE
+    compute_type = compute_type or WHISPER_COMPUTE_TYPE
+    cpu_threads = cpu_threads or WHISPER_CPU_THREADS
+    num_workers = num_workers or ASR_WORKERS
+
+    # num_workers lets one shared model run transcribe() from several threads
+    # in parallel (CTranslate2 releases the GIL).
+    def _load():
+        from faster_whisper import WhisperModel
+        return WhisperModel(size, device=device, compute_type=compute_type,
+                            cpu_threads=cpu_threads, num_workers=num_workers)
+
+    return _get_model(("whisper", size, device, compute_type, cpu_threads, num_workers), _load)
+
+
+def get_vosk_model(model_path: str):
+    def _load():
+        from vosk import Model
+        return Model(model_path)
+
+    return _get_model(("vosk", str(Path(model_path).resolve())), _load)
+
+
+def evict_idle():
+    with _models_lock:
+        _evict_locked(time.monotonic())
+
+
+def clear_models():
+    with _models_lock:
+        _models.clear()
+
+
+def loaded_models() -> list:
+    now = time.monotonic()
+    with _models_lock:
+        return [
+            {"key": k, "idle_secs": round(now - e.last_used, 1), "load_secs": round(e.load_secs, 2)}
+            for k, e in _models.items()
+        ]
+
+
+# ---------------- Warm-up ----------------
+_warmup_started = False
+_warmup_lock = threading.Lock()
+
+
+def _warm_up():
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    if capabilities.has("faster_whisper"):
+        try:
+            _transcribe_whisper(silence)
+            debug("[asr] warm-up faster-whisper done")
+        except Exception as e:
+            debug(f"[asr] warm-up faster-whisper skipped: {repr(e)}")
+    model_path = os.getenv("VOSK_MODEL_PATH")
+    if capabilities.has("vosk"):
+        try:
+            _transcribe_vosk(silence, model_path)
+            debug("[asr] warm-up vosk done")
+        except Exception as e:
+            debug(f"[asr] warm-up vosk skipped: {repr(e)}")
+
+
+def warm_up(blocking: bool = False):
+    """Load the configured models once per process (background thread by default)."""
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    if blocking:
+        _warm_up()
+    else:
+        threading.Thread(target=_warm_up, name="asr-warmup", daemon=True).start()
+
+
+# ---------------- Transcript cache ----------------
+# Keyed on the int16-quantised 16 kHz PCM (so container/codec framing doesn't
+# matter) plus every parameter that can change the recognised text.
+def _make_cache() -> Optional[TieredCache]:
+    if ASR_CACHE_ENTRIES <= 0:
+        return None
+    disk = None
+    if ASR_CACHE_DIR:
+        try:
+            disk = DiskCache(ASR_CACHE_DIR, int(ASR_CACHE_MAX_MB * 1024 * 1024))
+        except OSError as e:
+            debug(f"[asr cache] disk tier disabled: {repr(e)}")
+    return TieredCache(LRUCache(ASR_CACHE_ENTRIES), disk)
+
+
+_cache = _make_cache()
+
+
+def _cache_key(pcm: np.ndarray) -> str:
+    params = (
+        f"whisper:{WHISPER_MODEL}:{WHISPER_DEVICE}:{WHISPER_COMPUTE_TYPE}:beam=1:en"
+        f"|vosk:{os.getenv('VOSK_MODEL_PATH') or ''}"
+    )
+    return content_key(params, pcm_to_s16le(pcm))
+
+
+def cache_stats() -> dict:
+    return _cache.stats() if _cache is not None else {}
+
+
+# ---------------- Transcription ----------------
+def _transcribe_whisper(pcm, model=None) -> str:
+    model = model or get_whisper_model()
+    segments, _info = model.transcribe(pcm, beam_size=1, language="en")
+    return " ".join(s.text.strip() for s in segments).strip()
+
+
+def _transcribe_vosk(pcm, model_path: str) -> str:
+    from vosk import KaldiRecognizer
+    rec = KaldiRecognizer(get_vosk_model(model_path), SAMPLE_RATE)
+    rec.SetWords(True)
+    data = pcm_to_s16le(pcm)
+    step = 8000  # 4000 frames of s16le, as before
+    result = []
+    for i in range(0, len(data), step):
+        if rec.AcceptWaveform(data[i:i + step]):
+            result.append(json.loads(rec.Result()).get("text", ""))
+    result.append(json.loads(rec.FinalResult()).get("text", ""))
+    return " ".join(x.strip() for x in result if x).strip()
+
+
+def transcribe_local(audio_bytes: bytes, mime: str, pcm: Optional[np.ndarray] = None) -> str:
+    if pcm is None:
+        pcm = decode_audio(audio_bytes, mime)
+    if pcm is None or pcm.size == 0:
+        return ""
+    key, txt = _lookup(pcm)
+    if txt is not None:
+        return txt
+    segments = _speech_segments(pcm)
+    txt = _recognise_segments(segments) if segments else ""
+    _remember(key, txt)
+    return txt
+
+
+def _lookup(pcm: np.ndarray) -> tuple:
+    """(cache key or None, cached transcript or None)."""
+    if _cache is None:
+        return None, None
+    key = _cache_key(pcm)
+    txt = _cache.get(key)
+    count("avatharam_asr_cache_total", "Transcript cache lookups.", result="miss" if txt is None else "hit")
+    if txt is not None:
+        debug(f"[local asr] cache hit {key[:12]}")
+    return key, txt
+
+
+def _remember(key: Optional[str], txt: str):
+    # Empty results are not cached: they may come from a transient engine error.
+    if txt and key is not None:
+        _cache.put(key, txt)
+
+
+def _speech_segments(pcm: np.ndarray) -> list:
+    """Silence-trimmed pieces of the clip to recognise; [] when there is no speech."""
+    if not ASR_VAD:
+        return [pcm]
+    with span("vad", audio_secs=round(pcm.size / SAMPLE_RATE, 2)) as attrs:
+        segments = vad_split(pcm)
+        attrs["segments"] = len(segments)
+        attrs["speech_secs"] = round(sum(s.size for s in segments) / SAMPLE_RATE, 2)
+    if not segments:
+        count("avatharam_asr_no_speech_total", "Clips skipped because VAD found no speech.")
+        debug("[vad] no speech, skipping recognition")
+    return segments
+
+
+def _recognise_segments(segments: list) -> str:
+    secs = sum(s.size for s in segments) / SAMPLE_RATE
+    with span("asr", audio_secs=round(secs, 2), segments=len(segments)):
+        return " ".join(t for t in (_recognise(s) for s in segments) if t)
+
+
+def _recognise(pcm: np.ndarray) -> str:
+    # Engines that are not installed are skipped without an import attempt.
+    if capabilities.has("faster_whisper"):
+        try:
+            txt = _transcribe_whisper(pcm)
+            if txt:
+                return txt
+        except Exception as e:
+            debug(f"[local asr] faster-whisper error: {repr(e)}")
+    try:
+        if capabilities.has("vosk"):
+            txt = _transcribe_vosk(pcm, os.getenv("VOSK_MODEL_PATH"))
+            if txt:
+                return txt
+    except Exception as e:
+        debug(f"[local asr] vosk error: {repr(e)}")
+    return ""
+
+
+# ---------------- Worker pool ----------------
+# Every session's recognitions run on one bounded executor instead of inline
+# on its own script thread, so concurrent visitors share the cores instead of
+# fighting over them. Requests beyond ASR_WORKERS + ASR_QUEUE_MAX are turned
+# away immediately with status "busy". A long clip that VAD split at pauses
+# is spread over several workers when slots are free.
+class AsrResult:
+    __slots__ = ("text", "status", "wait", "service")
+
+    def __init__(self, text: str = "", status: str = "ok", wait: float = 0.0, service: float = 0.0):
+        self.text = text
+        self.status = status    # ok | cached | no_speech | busy | timeout | error
+        self.wait = wait        # queued before a worker picked it up (s)
+        self.service = service  # recognition time (s)
+
+    def __repr__(self):
+        return f"AsrResult(status={self.status!r}, chars={len(self.text)}, wait={self.wait:.3f}, service={self.service:.3f})"
+
+
+class AsrExecutor:
+    def __init__(self, workers: Optional[int] = None, queue_max: Optional[int] = None):
+        # Read at construction: apply_tuning() may have changed ASR_WORKERS.
+        workers = workers or ASR_WORKERS
+        queue_max = ASR_QUEUE_MAX if queue_max is None else queue_max
+        self.workers = workers
+        self.capacity = workers + queue_max
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _run(self, submitted: float, segments: list) -> AsrResult:
+        started = time.monotonic()
+        wait = started - submitted
+        observe("asr_wait", wait)
+        try:
+            text = _recognise_segments(segments)
+            status = "ok"
+        except Exception as e:
+            debug(f"[asr pool] recognition failed: {repr(e)}")
+            text, status = "", "error"
+        service = time.monotonic() - started
+        observe("asr_service", service)
+        return AsrResult(text, status, wait, service)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _jobs(self, segments: list) -> Optional[list]:
+        """Group segments into one job per acquired slot; None when the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        jobs = [[segments[0]]]
+        for seg in segments[1:]:
+            if len(jobs) < self.workers and self._slots.acquire(blocking=False):
+                jobs.append([seg])
+            else:
+                jobs[-1].append(seg)
+        return jobs
+
+    def transcribe(self, audio_bytes: bytes, mime: str, pcm: Optional[np.ndarray] = None,
+                   timeout: Optional[float] = ASR_TIMEOUT) -> AsrResult:
+        if pcm is None:
+            pcm = decode_audio(audio_bytes, mime)
+        if pcm is None or pcm.size == 0:
+            return AsrResult("", "ok")
+        key, txt = _lookup(pcm)
+        if txt is not None:
+            return AsrResult(txt, "cached")
+        segments = _speech_segments(pcm)
+        if not segments:
+            return AsrResult("", "no_speech")
+        jobs = self._jobs(segments)
+        if jobs is None:
+            with self._lock:
+                self.rejected += 1
+            count("avatharam_asr_rejected_total", "Recognitions turned away because the ASR queue was full.")
+            debug(f"[asr pool] busy: {self.capacity} requests in flight")
+            return AsrResult("", "busy")
+        with self._lock:
+            self.in_flight += len(jobs)
+        submitted = time.monotonic()
+        # Pool threads do not inherit contextvars; carry the visitor's correlation id.
+        futures = [self._pool.submit(run_in_context(self._run, submitted, job)) for job in jobs]
+        for f in futures:
+            f.add_done_callback(self._release)
+            # Whichever part finishes last caches the whole clip, even if the
+            # caller has stopped waiting by then.
+            f.add_done_callback(lambda _f: _remember_joined(key, futures))
+        deadline = None if timeout is None else submitted + timeout
+        try:
+            results = [f.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                       for f in futures]
+        except FutureTimeout:
+            debug(f"[asr pool] gave up waiting after {timeout}s")
+            return AsrResult("", "timeout")
+        status = "error" if any(r.status == "error" for r in results) else "ok"
+        return AsrResult(_join(results), status,
+                         max(r.wait for r in results), max(r.service for r in results))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "capacity": self.capacity,
+                    "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+def _join(results: list) -> str:
+    return " ".join(r.text for r in results if r.text)
+
+
+def _remember_joined(key: Optional[str], futures: list):
+    if key is None or not all(f.done() for f in futures):
+        return
+    results = [f.result() for f in futures]
+    if all(r.status == "ok" for r in results):
+        _remember(key, _join(results))
+
+
+_executor: Optional[AsrExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> AsrExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AsrExecutor(ASR_WORKERS, ASR_QUEUE_MAX)
+        return _executor
+
+
+def apply_tuning(choice: dict):
+    """Use a calibrated configuration (asr_tune) from the next recognition on."""
+    global WHISPER_MODEL, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS, ASR_WORKERS, _executor
+    if not os.getenv("WHISPER_MODEL"):
+        WHISPER_MODEL = choice["model"]
+    if not os.getenv("WHISPER_COMPUTE_TYPE"):
+        WHISPER_COMPUTE_TYPE = choice["compute_type"]
+    if not os.getenv("WHISPER_CPU_THREADS"):
+        WHISPER_CPU_THREADS = int(choice["cpu_threads"])
+    if not os.getenv("ASR_WORKERS"):
+        ASR_WORKERS = int(choice["num_workers"])
+    with _executor_lock:
+        if _executor is not None and _executor.workers != ASR_WORKERS:
+            old, _executor = _executor, None
+            old._pool.shutdown(wait=False)  # queued recognitions still finish
+    debug(f"[asr] tuned: {WHISPER_MODEL}/{WHISPER_COMPUTE_TYPE}, "
+          f"cpu_threads={WHISPER_CPU_THREADS}, workers={ASR_WORKERS}")
+
+
+def transcribe(audio_bytes: bytes, mime: str, pcm: Optional[np.ndarray] = None,
+               timeout: Optional[float] = ASR_TIMEOUT) -> AsrResult:
+    """Recognise on the shared worker pool (the entry point for UI code)."""
+    return get_executor().transcribe(audio_bytes, mime, pcm=pcm, timeout=timeout)
@@ -0,0 +1,301 @@
+# Calibration of the faster-whisper configuration for this host.
+#
+# Every candidate (model size x compute type x cpu_threads/num_workers split
+# of the cores) transcribes a reference clip with num_workers recognitions in
+# flight, as on a busy ASR pool. The real-time factor is a request's
+# recognition time over the clip length; accuracy is the word error rate
+# against the clip's transcript. The most accurate candidate whose RTF meets
+# ASR_TUNE_RTF is saved to ASR_TUNE_FILE, and asr.py starts with it on this
+# host (explicit WHISPER_* / ASR_WORKERS variables still win). Larger models
+# are skipped once every configuration of a smaller one misses the target.
+#
+#   python asr_tune.py --clip hello.wav --rtf 0.5   # transcript in hello.txt
+#
+# Without a transcript only speed is measured and accuracy is ranked by model
+# size, then precision. Without a clip the bench corpus's synthetic speech is
+# timed as a dry run: Whisper's decode time depends on the text it produces,
+# so that choice is reported but never saved. The start-up calibration
+# (ASR_TUNE=1) needs ASR_TUNE_CLIP and its transcript.
+#
+# Environment:
+#   ASR_TUNE          "1" calibrates in the background at start-up when no
+#                     choice is saved for this host              (default 0)
+#   ASR_TUNE_FILE     saved choice       (default ~/.cache/avatharam/asr_tune.json)
+#   ASR_TUNE_CLIP     reference clip; its transcript in the same name .txt
+#                     (both required for ASR_TUNE=1)
+#   ASR_TUNE_RTF      real-time factor to meet                   (default 0.5)
+#   ASR_TUNE_MODELS   sizes to try, smallest first     (default tiny,base,small)
+#   ASR_TUNE_COMPUTE  compute types to try   (default int8,int8_float32,float32)
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from applog import debug
+
+ASR_TUNE = os.getenv("ASR_TUNE", "0") == "1"
+ASR_TUNE_FILE = Path(os.getenv("ASR_TUNE_FILE") or Path.home() / ".cache" / "avatharam" / "asr_tune.json")
+ASR_TUNE_CLIP = os.getenv("ASR_TUNE_CLIP")
+ASR_TUNE_RTF = float(os.getenv("ASR_TUNE_RTF", "0.5"))
+ASR_TUNE_MODELS = [m for m in os.getenv("ASR_TUNE_MODELS", "tiny,base,small").split(",") if m]
+ASR_TUNE_COMPUTE = [c for c in os.getenv("ASR_TUNE_COMPUTE", "int8,int8_float32,float32").split(",") if c]
+
+# Accuracy order when there is no transcript to score against.
+MODEL_RANK = ("tiny", "base", "small", "medium", "large-v1", "large-v2", "large-v3")
+PRECISION_RANK = ("int8", "int8_float16", "int8_float32", "int8_bfloat16", "float16", "bfloat16", "float32")
+
+
+class Candidate:
+    __slots__ = ("model", "compute_type", "cpu_threads", "num_workers")
+
+    def __init__(self, model: str, compute_type: str, cpu_threads: int, num_workers: int):
+        self.model = model
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+
+    def as_dict(self) -> dict:
+        return {"model": self.model, "compute_type": self.compute_type,
+                "cpu_threads": self.cpu_threads, "num_workers": self.num_workers}
+
+    def __repr__(self):
+        return f"Candidate({self.model}/{self.compute_type}, threads={self.cpu_threads}, workers={self.num_workers})"
+
+
+def candidates(models=None, compute_types=None, cores: Optional[int] = None) -> list:
+    """Model x compute type x every workers/threads split that uses all cores."""
+    cores = cores or os.cpu_count() or 1
+    splits = [(max(1, cores // w), w) for w in (1, 2, 4) if w <= cores]
+    return [Candidate(m, c, threads, workers)
+            for m in (models or ASR_TUNE_MODELS)
+            for c in (compute_types or ASR_TUNE_COMPUTE)
+            for threads, workers in splits]
+
+
+def host() -> dict:
+    return {"cpus": os.cpu_count(), "machine": platform.machine(), "processor": platform.processor()}
+
+
+# ---------------- Scoring ----------------
+def _words(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1] / len(ref)
+
+
+def reference_clip(path: Optional[str] = None) -> tuple:
+    """(16 kHz mono pcm, transcript or None, name)."""
+    from audio import decode_audio, sniff_mime
+    path = path or ASR_TUNE_CLIP
+    if path:
+        data = Path(path).read_bytes()
+        txt = Path(path).with_suffix(".txt")
+        transcript = txt.read_text().strip() if txt.exists() else None
+        return decode_audio(data, sniff_mime(data)), transcript, Path(path).name
+    from audio import SAMPLE_RATE
+    from bench.corpus import speech_like
+    return speech_like(8.0, SAMPLE_RATE), None, "synthetic 8s"
+
+
+# ---------------- Measurement ----------------
+def measure(cand: Candidate, pcm, transcript: Optional[str], repeats: int = 2, device: Optional[str] = None) -> dict:
+    """Load ``cand`` outside asr's model registry and time it under load."""
+    import asr
+    from audio import SAMPLE_RATE
+    from faster_whisper import WhisperModel
+    out = cand.as_dict()
+    audio_secs = pcm.size / SAMPLE_RATE
+    t0 = time.perf_counter()
+    model = WhisperModel(cand.model, device=device or asr.WHISPER_DEVICE, compute_type=cand.compute_type,
+                         cpu_threads=cand.cpu_threads, num_workers=cand.num_workers)
+    out["load_secs"] = time.perf_counter() - t0
+    text = asr._transcribe_whisper(pcm, model=model)  # warm-up, also the scored text
+    times: list = []
+
+    def _one():
+        t = time.perf_counter()
+        asr._transcribe_whisper(pcm, model=model)
+        times.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        threads = [threading.Thread(target=_one, daemon=True) for _ in range(cand.num_workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - t0
+    times.sort()
+    out["rtf"] = times[len(times) // 2] / audio_secs
+    out["audio_secs_per_sec"] = len(times) * audio_secs / wall
+    out["wer"] = word_error_rate(transcript, text) if transcript is not None else None
+    out["text"] = text
+    return out
+
+
+def _accuracy_key(r: dict) -> tuple:
+    model = MODEL_RANK.index(r["model"]) if r["model"] in MODEL_RANK else -1
+    precision = PRECISION_RANK.index(r["compute_type"]) if r["compute_type"] in PRECISION_RANK else -1
+    return (r["wer"] if r["wer"] is not None else 0.0, -model, -precision)
+
+
+def choose(results: list, target: float) -> Optional[dict]:
+    """Most accurate result meeting ``target``; the fastest one if none does."""
+    done = [r for r in results if "rtf" in r]
+    if not done:
+        return None
+    ok = [r for r in done if r["rtf"] <= target]
+    if not ok:
+        return dict(min(done, key=lambda r: r["rtf"]), meets_target=False)
+    return dict(min(ok, key=lambda r: (_accuracy_key(r), -r["audio_secs_per_sec"])), meets_target=True)
+
+
+def calibrate(clip: Optional[str] = None, target: float = ASR_TUNE_RTF, models=None, compute_types=None,
+              repeats: int = 2, report=None) -> tuple:
+    """Measure every candidate; returns (choice or None, results)."""
+    pcm, transcript, name = reference_clip(clip)
+    debug(f"[asr tune] {name}, target RTF {target}, {'scored' if transcript else 'unscored'}")
+    results = []
+    current, met = None, False
+    for cand in candidates(models, compute_types):
+        if cand.model != current:
+            # Larger models are slower: stop once a whole size misses the target.
+            if current is not None and not met:
+                debug(f"[asr tune] {current} misses RTF {target}; skipping {cand.model} and larger")
+                break
+            current, met = cand.model, False
+        try:
+            r = measure(cand, pcm, transcript, repeats)
+        except Exception as e:
+            r = dict(cand.as_dict(), error=repr(e))
+            debug(f"[asr tune] {cand!r} failed: {repr(e)}")
+        results.append(r)
+        met = met or r.get("rtf", float("inf")) <= target
+        if report is not None:
+            report(r)
+    choice = choose(results, target)
+    if choice is not None:
+        choice.update(target_rtf=target, clip=name, host=host(), calibrated_at=time.time())
+        choice.pop("text", None)
+    return choice, results
+
+
+# ---------------- Saved choice ----------------
+def save_choice(choice: dict, path: Path = ASR_TUNE_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(choice, indent=2))
+    os.replace(tmp, path)
+
+
+def load_choice(path: Path = ASR_TUNE_FILE) -> dict:
+    """The saved choice for this host, or {} (missing, unreadable or another host)."""
+    try:
+        choice = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {}
+    saved = choice.get("host") or {}
+    if saved.get("cpus") != os.cpu_count() or saved.get("machine") != platform.machine():
+        debug(f"[asr tune] {path} was calibrated on another host; ignoring")
+        return {}
+    return choice
+
+
+# ---------------- Start-up ----------------
+_started = False
+_started_lock = threading.Lock()
+
+
+def _calibrate_and_apply():
+    import asr
+    try:
+        choice, _results = calibrate()
+    except Exception as e:
+        debug(f"[asr tune] calibration failed: {repr(e)}")
+        return
+    if choice is None:
+        return
+    try:
+        save_choice(choice)
+    except OSError as e:
+        debug(f"[asr tune] could not save {ASR_TUNE_FILE}: {repr(e)}")
+    asr.apply_tuning(choice)
+
+
+def start():
+    """With ASR_TUNE=1, calibrate once per process on a daemon thread if nothing is saved."""
+    global _started
+    import capabilities
+    with _started_lock:
+        if _started:
+            return
+        _started = True  # checked once per process, not on every rerun
+    if not ASR_TUNE or load_choice() or not capabilities.has("faster_whisper"):
+        return
+    if not (ASR_TUNE_CLIP and Path(ASR_TUNE_CLIP).with_suffix(".txt").exists()):
+        debug("[asr tune] ASR_TUNE=1 needs ASR_TUNE_CLIP and its .txt transcript; not calibrating")
+        return
+    threading.Thread(target=_calibrate_and_apply, name="asr-tune", daemon=True).start()
+
+
+def _print_row(r: dict):
+    if "error" in r:
+        print(f"{r['model']:>8} {r['compute_type']:>13} {r['cpu_threads']:>7} {r['num_workers']:>7}  error: {r['error']}")
+        return
+    wer = "-" if r["wer"] is None else f"{r['wer']:.3f}"
+    print(f"{r['model']:>8} {r['compute_type']:>13} {r['cpu_threads']:>7} {r['num_workers']:>7} "
+          f"{r['load_secs']:>7.1f} {r['rtf']:>7.3f} {r['audio_secs_per_sec']:>8.1f} {wer:>7}", flush=True)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Pick the faster-whisper configuration this host sustains.")
+    ap.add_argument("--clip", default=ASR_TUNE_CLIP, help="reference clip; transcript in the same name .txt")
+    ap.add_argument("--rtf", type=float, default=ASR_TUNE_RTF, help="real-time factor to meet")
+    ap.add_argument("--models", default=",".join(ASR_TUNE_MODELS), help="sizes to try, smallest first")
+    ap.add_argument("--compute", default=",".join(ASR_TUNE_COMPUTE), help="compute types to try")
+    ap.add_argument("--repeats", type=int, default=2, help="timed rounds per candidate")
+    ap.add_argument("--out", default=str(ASR_TUNE_FILE), help="where to save the choice")
+    ap.add_argument("--dry-run", action="store_true", help="report only, save nothing")
+    args = ap.parse_args(argv)
+
+    import capabilities
+    if not capabilities.has("faster_whisper"):
+        print("faster-whisper is not installed; nothing to calibrate", file=sys.stderr)
+        return 1
+    print(f"{'model':>8} {'compute':>13} {'threads':>7} {'workers':>7} {'load s':>7} {'RTF':>7} {'audio/s':>8} {'WER':>7}")
+    choice, _results = calibrate(args.clip, args.rtf, args.models.split(","), args.compute.split(","),
+                                 args.repeats, report=_print_row)
+    if choice is None:
+        print("no candidate could be measured", file=sys.stderr)
+        return 1
+    verdict = "meets" if choice["meets_target"] else "misses (fastest shown)"
+    print(f"choice: {choice['model']}/{choice['compute_type']}, cpu_threads={choice['cpu_threads']}, "
+          f"num_workers={choice['num_workers']}, RTF {choice['rtf']:.3f} {verdict} target {args.rtf}")
+    if not args.clip:
+        print("synthetic clip: timings do not reflect real speech, not saved (pass --clip)")
+    elif not args.dry_run:
+        save_choice(choice, Path(args.out))
+        print(f"saved to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
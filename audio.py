@@ -0,0 +1,90 @@
+# Audio helpers for Avatharam: format sniffing and one in-process decode stage.
+#
+# Mic bytes (wav/webm/ogg/mp4/mp3) are decoded once with PyAV into a 16 kHz
+# mono float32 NumPy buffer. The soundbar, faster-whisper and Vosk all read
+# from that buffer, so no ffmpeg subprocesses or temp files are involved.
+
+import io
+import wave
+from typing import Optional
+
+import numpy as np
+
+from applog import debug
+from tracing import span
+
+SAMPLE_RATE = 16000
+
+
+def sniff_mime(b: bytes) -> str:
+    try:
+        if len(b) >= 12 and b[:4] == b"RIFF" and b[8:12] == b"WAVE":
+            return "audio/wav"
+        if b.startswith(b"ID3") or (len(b) > 1 and b[0] == 0xFF and (b[1] & 0xE0) == 0xE0):
+            return "audio/mpeg"
+        if b.startswith(b"OggS"):
+            return "audio/ogg"
+        if len(b) >= 4 and b[:4] == b"\x1a\x45\xdf\xa3":
+            return "audio/webm"
+        if len(b) >= 12 and b[4:8] == b"ftyp":
+            return "audio/mp4"
+    except Exception:
+        pass
+    return "audio/wav"
+
+
+def decode_audio(audio_bytes: bytes, mime: str = "") -> Optional[np.ndarray]:
+    """Decode any container PyAV understands to 16 kHz mono float32 in [-1, 1]."""
+    try:
+        with span("decode", mime=mime):
+            pcm = _decode(audio_bytes)
+        debug(f"[decode] {mime or 'audio'} -> {pcm.size / SAMPLE_RATE:.2f}s pcm")
+        return pcm
+    except Exception as e:
+        debug(f"[decode] failed for {mime or 'audio'}: {repr(e)}")
+        return None
+
+
+def _decode(audio_bytes: bytes) -> np.ndarray:
+    import av
+    chunks = []
+    with av.open(io.BytesIO(audio_bytes), mode="r") as container:
+        stream = next(s for s in container.streams if s.type == "audio")
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    pcm16 = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+    return pcm16.astype(np.float32) / 32768.0
+
+
+def pcm_to_s16le(pcm: np.ndarray) -> bytes:
+    return (np.clip(pcm, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def pcm_to_wav_bytes(pcm: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(pcm_to_s16le(pcm))
+    return buf.getvalue()
+
+
+def prepare_for_soundbar(audio_bytes: bytes, mime: str, pcm: Optional[np.ndarray] = None) -> tuple[bytes, str]:
+    if mime in ("audio/webm", "audio/ogg"):
+        if pcm is None:
+            pcm = decode_audio(audio_bytes, mime)
+        ok = pcm is not None and pcm.size > 0
+        debug(f"[soundbar] convert={ok}, final_mime={'audio/wav' if ok else mime}")
+        if ok:
+            return pcm_to_wav_bytes(pcm), "audio/wav"
+        return audio_bytes, mime
+    if mime == "audio/mp4":
+        debug("[soundbar] pass mp4")
+        return audio_bytes, "audio/mp4"
+    debug(f"[soundbar] pass-through mime={mime}")
+    return audio_bytes, mime
@@ -0,0 +1,62 @@
+# Generated audio corpus for the benchmarks.
+#
+# Clips are synthetic "speech-like" signals (a few harmonics with a syllable-
+# rate envelope, a leading pause and a trailing pause) encoded with PyAV in
+# the containers the mic recorder can hand us.
+
+import io
+
+import numpy as np
+
+FORMATS = {
+    "wav": ("wav", "pcm_s16le", 48000),
+    "webm": ("webm", "libopus", 48000),
+    "ogg": ("ogg", "libopus", 48000),
+    "mp4": ("mp4", "aac", 48000),
+}
+DURATIONS = (1.5, 4.0, 8.0)
+
+
+def speech_like(secs: float, rate: int, seed: int = 0, lead: float = 0.5, tail: float = 0.4) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n = int(secs * rate)
+    t = np.arange(n) / rate
+    f0 = 120 + 40 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 0.5  # ~4 syllables/s
+    x = 0.25 * voice * envelope + 0.003 * rng.standard_normal(n)
+    x[: int(lead * rate)] = 0.003 * rng.standard_normal(int(lead * rate))
+    if tail:
+        x[-int(tail * rate):] = 0.003 * rng.standard_normal(int(tail * rate))
+    return np.clip(x, -1, 1).astype(np.float32)
+
+
+def encode(pcm: np.ndarray, fmt: str) -> bytes:
+    import av
+    container_fmt, codec, rate = FORMATS[fmt]
+    samples = (pcm * 32767).astype(np.int16)
+    buf = io.BytesIO()
+    with av.open(buf, "w", format=container_fmt) as c:
+        stream = c.add_stream(codec, rate=rate)
+        stream.layout = "mono"
+        step = 960
+        for i in range(0, len(samples), step):
+            frame = av.AudioFrame.from_ndarray(samples[None, i:i + step], format="s16", layout="mono")
+            frame.sample_rate = rate
+            frame.pts = i
+            for packet in stream.encode(frame):
+                c.mux(packet)
+        for packet in stream.encode(None):
+            c.mux(packet)
+    return buf.getvalue()
+
+
+def build(formats=tuple(FORMATS), durations=DURATIONS) -> list:
+    """[(name, bytes)] for every format x duration."""
+    clips = []
+    for seed, secs in enumerate(durations):
+        for fmt in formats:
+            rate = FORMATS[fmt][2]
+            clips.append((f"{fmt}-{secs:g}s", encode(speech_like(secs, rate, seed=seed), fmt)))
+    return clips
@@ -0,0 +1,158 @@
+# Per-stage latency benchmark for one voice turn.
+#
+# Runs the real helpers (sniff_mime, decode, prepare_for_soundbar, vad,
+# transcribe_local, HeyGen session/task/stop, ChatGPT one-shot and streaming)
+# against a generated audio corpus and local HeyGen/OpenAI stand-ins, then
+# reports p50/p95 per stage.
+#
+#   python -m bench.latency --iterations 10 --json bench_output.json
+#   python -m bench.latency --baseline bench_output.json   # exit 1 on p95 regression
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import applog  # noqa: E402
+import asr  # noqa: E402
+import capabilities  # noqa: E402
+import heygen  # noqa: E402
+import llm  # noqa: E402
+import speech_queue  # noqa: E402
+import vad  # noqa: E402
+from audio import decode_audio, prepare_for_soundbar, sniff_mime  # noqa: E402
+from bench import corpus  # noqa: E402
+from bench.stubs import StubConfig, point_helpers_at, start_stub  # noqa: E402
+
+
+class Timings:
+    def __init__(self):
+        self.samples: dict = {}
+
+    def add(self, stage: str, secs: float):
+        self.samples.setdefault(stage, []).append(secs)
+
+    def time(self, stage: str, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.add(stage, time.perf_counter() - t0)
+        return out
+
+    def summary(self) -> dict:
+        out = {}
+        for stage, xs in self.samples.items():
+            a = np.asarray(xs) * 1000.0
+            out[stage] = {
+                "n": len(xs),
+                "p50_ms": float(np.percentile(a, 50)),
+                "p95_ms": float(np.percentile(a, 95)),
+                "max_ms": float(a.max()),
+            }
+        return out
+
+
+def asr_available() -> bool:
+    return capabilities.has("faster_whisper") or capabilities.has("vosk")
+
+
+def bench_audio(t: Timings, clips: list, iterations: int, with_asr: bool):
+    for _ in range(iterations):
+        for _name, data in clips:
+            mime = t.time("sniff_mime", sniff_mime, data)
+            pcm = t.time("decode", decode_audio, data, mime)
+            t.time("prepare_for_soundbar", prepare_for_soundbar, data, mime, pcm=pcm)
+            t.time("vad", vad.split, pcm)
+            if with_asr:
+                t.time("transcribe_local", asr.transcribe_local, data, mime, pcm=pcm)
+
+
+def bench_network(t: Timings, iterations: int):
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        created = t.time("heygen.new_session", heygen.new_session, "bench_avatar", "bench_voice")
+        tok = t.time("heygen.create_session_token", heygen.create_session_token, created["session_id"])
+        t.add("session_start", time.perf_counter() - t0)
+        t.time("heygen.send_text_to_avatar", heygen.send_text_to_avatar, created["session_id"], tok, "Hello there.")
+        t.time("llm.chat_completion", llm.chat_completion, "bench-key", "What do you do?", use_cache=False)
+        sid = created["session_id"]
+        _reply, timings = llm.stream_reply("bench-key", "What do you do?",
+                                           speak=lambda chunk: speech_queue.speak(sid, tok, chunk), use_cache=False)
+        speech_queue.peek_worker(sid).wait_idle(30)
+        speech_queue.close_worker(sid)
+        t.add("llm.stream.first_sentence", timings["first_sentence"])
+        if timings["first_speech"] is not None:
+            t.add("llm.stream.first_speech", timings["first_speech"])
+        t.add("llm.stream.total", timings["total"])
+        t.time("heygen.stop_session", heygen.stop_session, created["session_id"], tok)
+
+
+def print_report(summary: dict):
+    width = max(len(s) for s in summary) + 2
+    print(f"{'stage'.ljust(width)}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for stage, s in summary.items():
+        print(f"{stage.ljust(width)}{s['n']:>6}{s['p50_ms']:>12.2f}{s['p95_ms']:>12.2f}{s['max_ms']:>12.2f}")
+
+
+def compare(summary: dict, baseline_path: str, tolerance: float) -> list:
+    baseline = json.loads(Path(baseline_path).read_text())["stages"]
+    regressions = []
+    for stage, s in summary.items():
+        base = baseline.get(stage)
+        if base and s["p95_ms"] > base["p95_ms"] * (1 + tolerance) + 1.0:
+            regressions.append(f"{stage}: p95 {s['p95_ms']:.1f} ms vs baseline {base['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Per-stage latency benchmark against local HeyGen/OpenAI stand-ins.")
+    ap.add_argument("--iterations", type=int, default=5)
+    ap.add_argument("--formats", default=",".join(corpus.FORMATS), help="comma-separated subset of wav,webm,ogg,mp4")
+    ap.add_argument("--heygen-delay", type=float, default=0.05, help="streaming.new/create_token/stop delay (s)")
+    ap.add_argument("--task-delay", type=float, default=0.2, help="streaming.task delay (s)")
+    ap.add_argument("--openai-ttft", type=float, default=0.3, help="OpenAI time to first token (s)")
+    ap.add_argument("--openai-token-delay", type=float, default=0.02, help="delay between streamed tokens (s)")
+    ap.add_argument("--skip-asr", action="store_true", help="skip transcribe_local even if an engine is installed")
+    ap.add_argument("--asr-cache", action="store_true", help="keep the transcript cache on (default: measure cold ASR)")
+    ap.add_argument("--json", help="write the summary to this file")
+    ap.add_argument("--baseline", help="compare p95s against a previous --json file")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth vs baseline (fraction)")
+    ap.add_argument("--verbose", action="store_true", help="keep debug() output")
+    args = ap.parse_args(argv)
+
+    applog.DEBUG = args.verbose
+    if not args.asr_cache:
+        asr._cache = None
+    stub = start_stub(StubConfig(args.heygen_delay, args.task_delay, args.openai_ttft, args.openai_token_delay))
+    point_helpers_at(stub.base_url)
+
+    with_asr = not args.skip_asr and asr_available()
+    if not with_asr and not args.skip_asr:
+        print("note: no ASR engine installed; transcribe_local skipped", file=sys.stderr)
+    clips = corpus.build(formats=tuple(f for f in args.formats.split(",") if f))
+    if with_asr:
+        asr.warm_up(blocking=True)  # keep one-off model load out of the percentiles
+
+    t = Timings()
+    bench_audio(t, clips, args.iterations, with_asr)
+    bench_network(t, args.iterations)
+    stub.shutdown()
+
+    summary = t.summary()
+    print_report(summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"stages": summary, "args": vars(args)}, indent=2))
+    if args.baseline:
+        regressions = compare(summary, args.baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
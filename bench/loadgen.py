@@ -0,0 +1,318 @@
+# Multi-visitor load test for the Streamlit app.
+#
+# Each simulated visitor is an AppTest driving the real streamlit_app.py in
+# this process, one script thread per visitor as under `streamlit run`, so
+# the process-wide pieces (session registry and pools, speech workers, ASR
+# executor, caches) are shared exactly as in production. A visitor
+# auto-starts its avatar session, then does --turns voice turns: a corpus
+# clip arrives through a stand-in for the mic recorder, the script decodes
+# and transcribes it, and ChatGPT is clicked, which streams the reply into
+# the visitor's speech worker. HeyGen and OpenAI are the bench/stubs.py
+# stand-ins.
+#
+# Concurrency steps through --users. Each level reports turns/s, turn
+# latency percentiles (recording -> avatar accepted the whole reply), RSS
+# growth per visitor and errors; the knee is the first level whose p95 turn
+# latency exceeds --knee-factor x the lowest level's.
+#
+# AppTest skips the websocket and the browser, so these are lower bounds on
+# what a real visitor sees.
+#
+#   python -m bench.loadgen --users 1,2,4,8,16 --turns 3 --json load.json
+
+import argparse
+import gc
+import importlib.machinery
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import applog  # noqa: E402
+import asr  # noqa: E402
+import heygen  # noqa: E402
+import llm  # noqa: E402
+import session_pool  # noqa: E402
+from bench import corpus  # noqa: E402
+from bench.latency import asr_available  # noqa: E402
+from bench.stubs import StubConfig, point_helpers_at, start_stub  # noqa: E402
+from speech_queue import close_worker, peek_worker  # noqa: E402
+
+APP = str(Path(__file__).resolve().parent.parent / "streamlit_app.py")
+CLIP_KEY = "_loadgen_clip"
+
+
+# ---------------- Harness plumbing ----------------
+def _install_mic():
+    """Stand in for streamlit_mic_recorder: returns the clip a visitor queued."""
+    import streamlit as st
+    mod = types.ModuleType("streamlit_mic_recorder")
+    mod.__spec__ = importlib.machinery.ModuleSpec("streamlit_mic_recorder", None)
+
+    def mic_recorder(**_kwargs):
+        clip = st.session_state.pop(CLIP_KEY, None)
+        return {"bytes": clip, "sample_rate": 48000, "format": "webm"} if clip else None
+
+    mod.mic_recorder = mic_recorder
+    sys.modules["streamlit_mic_recorder"] = mod
+
+
+def _share_server_state(secrets: dict):
+    # AppTest installs a mock Runtime (and st.secrets) for one run and clears
+    # it afterwards, so one visitor's teardown would pull them out from under
+    # another's run. Keep the last runtime reachable and install the secrets
+    # once for every visitor instead. It also compiles the script on every
+    # run; the server keeps one ScriptCache, so share one here too (and
+    # concurrent compiles trip a CPython 3.11 ast bug).
+    import streamlit as st
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import local_script_runner
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+        rt = cls._instance or last.get("runtime")
+        if rt is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return rt
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+    shared = Secrets()
+    shared._secrets = secrets
+    st.secrets = shared
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+# ---------------- One visitor ----------------
+class Visitor:
+    def __init__(self, n: int, clips: list, turns: int, think: float, timeout: float):
+        self.n = n
+        self.clips = clips
+        self.turns = turns
+        self.think = think
+        self.timeout = timeout
+        self.samples: dict = {}
+        self.errors: list = []
+        self.completed = 0
+
+    def _add(self, stage: str, secs: float):
+        self.samples.setdefault(stage, []).append(secs)
+
+    def _run_app(self, at, stage: str) -> float:
+        t0 = time.perf_counter()
+        at.run(timeout=self.timeout)
+        secs = time.perf_counter() - t0
+        if at.exception:
+            raise RuntimeError(f"{stage}: {at.exception[0].message}")
+        self._add(stage, secs)
+        return secs
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP, default_timeout=self.timeout)
+        try:
+            self._run_app(at, "start")
+            sid, tok = at.session_state["session_id"], at.session_state["session_token"]
+            if not (sid and tok):
+                raise RuntimeError("start: no avatar session")
+            for i in range(self.turns):
+                if i and self.think:
+                    time.sleep(self.think)
+                _name, clip = self.clips[(self.n + i) % len(self.clips)]
+                at.session_state[CLIP_KEY] = clip
+                t_turn = self._run_app(at, "transcribe")
+                at.button(key="btn_chatgpt_main").click()
+                t_turn += self._run_app(at, "reply")
+                t0 = time.perf_counter()
+                worker = peek_worker(sid)
+                if worker is not None and not worker.wait_idle(self.timeout):
+                    raise RuntimeError("speech: queue did not drain")
+                t_turn += time.perf_counter() - t0
+                timing = at.session_state["last_turn_timing"] or {}
+                if timing.get("first_speech") is not None:
+                    self._add("first_speech", timing["first_speech"])
+                self._add("turn", t_turn)
+                self.completed += 1
+        except Exception as e:
+            self.errors.append(repr(e))
+        finally:
+            try:
+                sid, tok = at.session_state["session_id"], at.session_state["session_token"]
+                close_worker(sid)
+                heygen.stop_session(sid, tok)
+            except Exception:
+                pass
+
+
+# ---------------- Levels ----------------
+def percentiles(xs: list) -> dict:
+    if not xs:
+        return {"n": 0}
+    a = np.asarray(xs) * 1000.0
+    return {"n": len(xs), "p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95)),
+            "p99_ms": float(np.percentile(a, 99)), "max_ms": float(a.max())}
+
+
+def run_level(users: int, clips: list, args) -> dict:
+    gc.collect()
+    rss0 = rss_bytes()
+    visitors = [Visitor(i, clips, args.turns, args.think, args.timeout) for i in range(users)]
+    threads = [threading.Thread(target=v.run, name=f"visitor-{v.n}", daemon=True) for v in visitors]
+    t0 = time.perf_counter()
+    with RssSampler() as rss:
+        for i, t in enumerate(threads):
+            if i and args.ramp:
+                time.sleep(args.ramp / users)
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - t0
+    stages: dict = {}
+    for v in visitors:
+        for stage, xs in v.samples.items():
+            stages.setdefault(stage, []).extend(xs)
+    turns = sum(v.completed for v in visitors)
+    errors = [e for v in visitors for e in v.errors]
+    return {
+        "users": users,
+        "wall_s": wall,
+        "turns": turns,
+        "turns_per_s": turns / wall if wall else 0.0,
+        "stages": {stage: percentiles(xs) for stage, xs in stages.items()},
+        "rss_mb": rss.peak / 2**20,
+        "rss_per_user_mb": max(0, rss.peak - rss0) / users / 2**20,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+    }
+
+
+def find_knee(levels: list, factor: float):
+    """First level whose p95 turn latency exceeds factor x the first level's."""
+    base = levels[0]["stages"].get("turn", {}).get("p95_ms") if levels else None
+    if not base:
+        return None
+    for lvl in levels[1:]:
+        p95 = lvl["stages"].get("turn", {}).get("p95_ms")
+        if p95 is None or p95 > factor * base or lvl["errors"]:
+            return lvl["users"]
+    return None
+
+
+def print_report(levels: list, knee):
+    print(f"{'users':>6}{'turns/s':>10}{'turn p50':>11}{'turn p95':>11}{'turn p99':>11}"
+          f"{'start p95':>11}{'RSS MB':>9}{'MB/user':>9}{'errors':>8}")
+    for lvl in levels:
+        turn, start = lvl["stages"].get("turn", {}), lvl["stages"].get("start", {})
+        ms = lambda s, k: f"{s[k]:.0f}" if k in s else "-"
+        print(f"{lvl['users']:>6}{lvl['turns_per_s']:>10.2f}{ms(turn, 'p50_ms'):>11}{ms(turn, 'p95_ms'):>11}"
+              f"{ms(turn, 'p99_ms'):>11}{ms(start, 'p95_ms'):>11}{lvl['rss_mb']:>9.0f}"
+              f"{lvl['rss_per_user_mb']:>9.1f}{lvl['errors']:>8}")
+        for e in lvl["error_samples"]:
+            print(f"{'':>6}  error: {e}")
+    best = max(levels, key=lambda lvl: lvl["turns_per_s"])
+    print(f"peak throughput {best['turns_per_s']:.2f} turns/s at {best['users']} users")
+    print(f"latency knee at {knee} users" if knee else "no latency knee within the tested levels")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Concurrent visitors through streamlit_app.py against local stand-ins.")
+    ap.add_argument("--users", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    ap.add_argument("--turns", type=int, default=3, help="voice turns per visitor")
+    ap.add_argument("--think", type=float, default=0.5, help="pause between a visitor's turns (s)")
+    ap.add_argument("--ramp", type=float, default=1.0, help="spread visitor arrivals over this many seconds")
+    ap.add_argument("--format", default="webm", choices=list(corpus.FORMATS), help="recorded clip container")
+    ap.add_argument("--heygen-delay", type=float, default=0.05, help="streaming.new/create_token/stop delay (s)")
+    ap.add_argument("--task-delay", type=float, default=0.2, help="streaming.task delay (s)")
+    ap.add_argument("--openai-ttft", type=float, default=0.3, help="OpenAI time to first token (s)")
+    ap.add_argument("--openai-token-delay", type=float, default=0.02, help="delay between streamed tokens (s)")
+    ap.add_argument("--ready-delay", type=float, help="override HEYGEN_READY_DELAY (s)")
+    ap.add_argument("--cache", action="store_true", help="keep the ASR and reply caches on (default: every turn is cold)")
+    ap.add_argument("--timeout", type=float, default=120.0, help="per script run / speech drain (s)")
+    ap.add_argument("--knee-factor", type=float, default=2.0, help="p95 growth over the first level that marks the knee")
+    ap.add_argument("--json", help="write the levels to this file")
+    ap.add_argument("--verbose", action="store_true", help="keep debug() output")
+    args = ap.parse_args(argv)
+
+    applog.DEBUG = args.verbose
+    if not args.cache:
+        asr._cache = None
+        llm.LLM_CACHE = False
+    if args.ready_delay is not None:
+        session_pool.HEYGEN_READY_DELAY = args.ready_delay
+    stub = start_stub(StubConfig(args.heygen_delay, args.task_delay, args.openai_ttft, args.openai_token_delay))
+    point_helpers_at(stub.base_url)
+    _install_mic()
+    _share_server_state({"HeyGen": {"heygen_api_key": "bench-key"}, "openai": {"secret_key": "bench-key"}})
+    if not asr_available():
+        print("note: no ASR engine installed; turns decode and VAD the clip but send no transcript", file=sys.stderr)
+    clips = corpus.build(formats=(args.format,))
+    if asr_available():
+        asr.warm_up(blocking=True)
+    # One untimed visitor first, so imports and model loads stay out of level 1.
+    warm = Visitor(0, clips, 1, 0.0, args.timeout)
+    warm.run()
+    if warm.errors:
+        print(f"warm-up visitor failed: {warm.errors[0]}", file=sys.stderr)
+
+    levels = []
+    for users in (int(u) for u in args.users.split(",") if u):
+        levels.append(run_level(users, clips, args))
+        print(f"... {users} users: {levels[-1]['turns_per_s']:.2f} turns/s", file=sys.stderr)
+    stub.shutdown()
+
+    knee = find_knee(levels, args.knee_factor)
+    print_report(levels, knee)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"levels": levels, "knee_users": knee, "args": vars(args)}, indent=2))
+    # A level with errors or no finished turn measured a broken app, not its capacity.
+    failed = [lvl for lvl in levels if lvl["errors"] or not lvl["turns"]]
+    for lvl in failed:
+        print(f"{lvl['users']} users: {lvl['errors']} errors, {lvl['turns']} turns; "
+              f"e.g. {lvl['error_samples'][:1]}", file=sys.stderr)
+    return 1 if failed or not levels else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# Local stand-ins for the HeyGen streaming.* and OpenAI chat/completions APIs.
+#
+# The responses have the same shape the helpers parse, and every endpoint can
+# be given a delay so benchmarks can model real network and service time.
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Hello, and welcome to Avatharam. I can answer questions about our services. "
+    "Ask me anything you like, and I will do my best to help. Have a lovely day!"
+)
+
+
+class StubConfig:
+    def __init__(self, heygen_delay: float = 0.05, task_delay: float = 0.2, openai_ttft: float = 0.3,
+                 openai_token_delay: float = 0.02, reply: str = DEFAULT_REPLY, status_429_every: int = 0):
+        self.heygen_delay = heygen_delay            # streaming.new / create_token / stop
+        self.task_delay = task_delay                # streaming.task (sync speech)
+        self.openai_ttft = openai_ttft              # time to first token
+        self.openai_token_delay = openai_token_delay
+        self.reply = reply
+        self.status_429_every = status_429_every    # every Nth request gets 429 (0 = never)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes
+    server: "StubServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, body: dict, status: int = 200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        cfg = self.server.config
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        n = self.server.count(self.path)
+        if cfg.status_429_every and n % cfg.status_429_every == 0:
+            return self._json({"error": "rate limited"}, status=429)
+
+        if self.path.endswith("/chat/completions"):
+            time.sleep(cfg.openai_ttft)
+            tokens = [t + " " for t in cfg.reply.split(" ")]
+            if not body.get("stream"):
+                time.sleep(cfg.openai_token_delay * len(tokens))
+                return self._json({"choices": [{"message": {"role": "assistant", "content": cfg.reply}}]})
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(cfg.openai_token_delay)
+                self._chunk("data: " + json.dumps({"choices": [{"delta": {"content": tok}}]}) + "\n\n")
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        name = self.path.rsplit("/", 1)[-1]
+        if name == "streaming.new":
+            time.sleep(cfg.heygen_delay)
+            return self._json({"data": {
+                "session_id": uuid.uuid4().hex,
+                "offer": {"type": "offer", "sdp": "v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\n"},
+                "ice_servers2": [{"urls": ["stun:stun.l.google.com:19302"]}],
+            }})
+        if name == "streaming.create_token":
+            time.sleep(cfg.heygen_delay)
+            return self._json({"data": {"token": uuid.uuid4().hex}})
+        if name == "streaming.task":
+            time.sleep(cfg.task_delay)
+            return self._json({"data": {"task_id": uuid.uuid4().hex, "duration_ms": int(cfg.task_delay * 1000)}})
+        if name in ("streaming.stop", "streaming.interrupt"):
+            time.sleep(cfg.heygen_delay)
+            return self._json({"data": {}})
+        return self._json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig, port: int = 0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.config = config
+        self.calls: dict = {}
+        self._lock = threading.Lock()
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+            return sum(self.calls.values())
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, name="bench-stub", daemon=True).start()
+        return self
+
+
+def start_stub(config: StubConfig = None) -> StubServer:
+    return StubServer(config or StubConfig()).start()
+
+
+def point_helpers_at(base_url: str):
+    """Re-point the already-imported heygen/llm modules at a stub server."""
+    import heygen
+    import llm
+    heygen.BASE = base_url
+    heygen.API_STREAM_NEW = f"{base_url}/streaming.new"
+    heygen.API_CREATE_TOKEN = f"{base_url}/streaming.create_token"
+    heygen.API_STREAM_TASK = f"{base_url}/streaming.task"
+    heygen.API_STREAM_STOP = f"{base_url}/streaming.stop"
+    heygen.API_STREAM_INTERRUPT = f"{base_url}/streaming.interrupt"
+    heygen.API_STREAM_START = f"{base_url}/streaming.start"
+    llm.OPENAI_URL = f"{base_url}/chat/completions"
@@ -0,0 +1,166 @@
+# Small process-wide caches used by the ASR and LLM helpers.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from applog import debug
+
+
+def content_key(*parts) -> str:
+    """sha256 over str/bytes parts, with separators so ('ab','c') != ('a','bc')."""
+    h = hashlib.sha256()
+    for p in parts:
+        b = p if isinstance(p, (bytes, bytearray, memoryview)) else str(p).encode("utf-8")
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.time() - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, value, stored_at: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (stored_at if stored_at is not None else time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def items(self) -> list:
+        with self._lock:
+            return [(k, t, v) for k, (t, v) in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class DiskCache:
+    """One small UTF-8 file per key under ``directory``, trimmed to ``max_bytes`` by LRU (mtime)."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = sum(size for _m, size, _f in self._scan())
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.dir / f"{key}.txt"
+
+    def _scan(self) -> list:
+        files = []
+        for f in self.dir.glob("*.txt"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        return files
+
+    def get(self, key: str) -> Optional[str]:
+        p = self._path(key)
+        try:
+            value = p.read_text(encoding="utf-8")
+            os.utime(p)  # bump for LRU trimming
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        p = self._path(key)
+        tmp = p.with_suffix(f".{threading.get_ident()}.tmp")
+        data = value.encode("utf-8")
+        try:
+            old = p.stat().st_size if p.exists() else 0
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        except OSError as e:
+            debug(f"[cache] disk write failed: {repr(e)}")
+            return
+        with self._lock:
+            self._total += len(data) - old
+            if self._total > self.max_bytes:
+                self._trim_locked()
+
+    def _trim_locked(self):
+        # Trim to 90% so we don't rescan on every following write.
+        files = self._scan()
+        self._total = sum(size for _m, size, _f in files)
+        target = int(self.max_bytes * 0.9)
+        for _mtime, size, f in sorted(files):
+            if self._total <= target:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            self._total -= size
+
+    def stats(self) -> dict:
+        return {"dir": str(self.dir), "bytes": self._total, "hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """Memory LRU in front of an optional DiskCache; disk hits are promoted."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: str):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self) -> dict:
+        out = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            out["disk"] = self.disk.stats()
+        return out
@@ -0,0 +1,197 @@
+# What this process can do, probed once and cached.
+#
+# Detecting an optional engine must not import it: availability comes from
+# importlib.util.find_spec and package metadata, and ffmpeg is run once with
+# -version. start() probes everything on a background thread and then imports
+# the heavy modules there too (ctranslate2 via faster_whisper, PyAV,
+# requests), so the Streamlit render path finds them already in sys.modules.
+# Each import's wall time is kept for import_report() and logged once the
+# preload finishes.
+#
+#   python capabilities.py     # capabilities + cold import cost per dependency
+#
+# Environment:
+#   CAPABILITY_PRELOAD   "0" skips importing heavy modules in the background
+
+import importlib
+import importlib.metadata
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from applog import debug
+
+CAPABILITY_PRELOAD = os.getenv("CAPABILITY_PRELOAD", "1") != "0"
+
+
+class Capability:
+    __slots__ = ("name", "available", "detail", "probe_secs")
+
+    def __init__(self, name: str, available: bool, detail: str = "", probe_secs: float = 0.0):
+        self.name = name
+        self.available = available
+        self.detail = detail
+        self.probe_secs = probe_secs
+
+    def __repr__(self):
+        return f"Capability({self.name!r}, available={self.available}, detail={self.detail!r})"
+
+
+# ---------------- Probes ----------------
+def _probe_module(module: str, dist: str) -> tuple:
+    if importlib.util.find_spec(module) is None:
+        return False, "not installed"
+    try:
+        return True, importlib.metadata.version(dist)
+    except importlib.metadata.PackageNotFoundError:
+        return True, "installed"
+
+
+def _probe_ffmpeg() -> tuple:
+    path = shutil.which("ffmpeg")
+    if path is None:
+        return False, "not on PATH"
+    try:
+        out = subprocess.run([path, "-version"], capture_output=True, text=True, timeout=5)
+        return out.returncode == 0, (out.stdout.splitlines() or [path])[0]
+    except (OSError, subprocess.SubprocessError) as e:
+        return False, repr(e)
+
+
+def _probe_vosk() -> tuple:
+    ok, detail = _probe_module("vosk", "vosk")
+    if not ok:
+        return ok, detail
+    path = os.getenv("VOSK_MODEL_PATH")
+    if not path:
+        return False, "VOSK_MODEL_PATH not set"
+    if not Path(path).exists():
+        return False, f"no model at {path}"
+    return True, f"{detail}, model {path}"
+
+
+_PROBES = {
+    "ffmpeg": _probe_ffmpeg,
+    "faster_whisper": lambda: _probe_module("faster_whisper", "faster-whisper"),
+    "vosk": _probe_vosk,
+    "mic_recorder": lambda: _probe_module("streamlit_mic_recorder", "streamlit-mic-recorder"),
+    "webrtc": lambda: _probe_module("streamlit_webrtc", "streamlit-webrtc"),
+    "tiktoken": lambda: _probe_module("tiktoken", "tiktoken"),
+}
+
+# (module, capability it depends on or None); imported in this order.
+PRELOAD = (
+    ("requests", None),
+    ("av", None),
+    ("streamlit_mic_recorder", "mic_recorder"),
+    ("faster_whisper", "faster_whisper"),
+    ("vosk", "vosk"),
+)
+
+_caps: dict = {}
+_caps_lock = threading.Lock()
+_imports: list = []  # [{"module", "secs", "ok"}] from the background preload
+_started = False
+_done = threading.Event()
+
+
+def get(name: str) -> Capability:
+    """Probe ``name`` on first use; later calls return the cached result."""
+    cap = _caps.get(name)
+    if cap is not None:
+        return cap
+    with _caps_lock:
+        cap = _caps.get(name)
+        if cap is None:
+            t0 = time.perf_counter()
+            try:
+                ok, detail = _PROBES[name]()
+            except Exception as e:
+                ok, detail = False, repr(e)
+            cap = _caps[name] = Capability(name, ok, detail, time.perf_counter() - t0)
+            debug(f"[caps] {name}: {'yes' if ok else 'no'} ({detail})")
+        return cap
+
+
+def has(name: str) -> bool:
+    return get(name).available
+
+
+def all_capabilities() -> dict:
+    return {name: get(name) for name in _PROBES}
+
+
+# ---------------- Background start-up ----------------
+def _preload():
+    for module, needs in PRELOAD:
+        if module in sys.modules or (needs is not None and not has(needs)):
+            continue
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            ok = True
+        except Exception as e:
+            ok = False
+            debug(f"[caps] preload {module} failed: {repr(e)}")
+        _imports.append({"module": module, "secs": time.perf_counter() - t0, "ok": ok})
+
+
+def _start():
+    try:
+        all_capabilities()
+        if CAPABILITY_PRELOAD:
+            _preload()
+            report = ", ".join(f"{r['module']} {r['secs'] * 1000:.0f}ms{'' if r['ok'] else ' (failed)'}"
+                               for r in import_report())
+            if report:
+                debug(f"[caps] preloaded {report}")
+    finally:
+        _done.set()
+
+
+def start():
+    """Probe and preload once per process on a daemon thread."""
+    global _started
+    with _caps_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_start, name="capabilities", daemon=True).start()
+
+
+def wait(timeout: Optional[float] = None) -> bool:
+    return _done.wait(timeout)
+
+
+def import_report() -> list:
+    """Wall time of each background preload import, slowest first."""
+    return sorted(_imports, key=lambda r: r["secs"], reverse=True)
+
+
+def cold_import_cost(module: str) -> Optional[float]:
+    """Seconds to import ``module`` in a fresh interpreter (python -X importtime)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    for line in reversed(out.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    return None
+
+
+if __name__ == "__main__":
+    for cap in all_capabilities().values():
+        print(f"{cap.name:16} {'yes' if cap.available else 'no ':4} {cap.detail}")
+    print()
+    modules = ["streamlit", "numpy", "requests"] + [m for m, needs in PRELOAD[1:] if needs is None or has(needs)]
+    for module in modules:
+        secs = cold_import_cost(module)
+        print(f"import {module:24} {'failed' if secs is None else f'{secs * 1000:8.1f} ms'}")
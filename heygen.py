@@ -0,0 +1,141 @@
+# HeyGen streaming API helpers for Avatharam.
+#
+# Kept out of streamlit_app.py so background workers (session pool, speech
+# queue) can call them without a Streamlit script run. The app passes its
+# API key in through configure(). Every session created here is tracked in
+# session_registry until stop_session.
+
+import json
+import os
+from typing import Optional
+
+from applog import debug
+from http_client import get_client
+from session_registry import get_registry
+from tracing import span
+
+# ---------------- Endpoints ----------------
+BASE = os.getenv("HEYGEN_BASE_URL", "https://api.heygen.com/v1").rstrip("/")
+API_STREAM_NEW = f"{BASE}/streaming.new"
+API_CREATE_TOKEN = f"{BASE}/streaming.create_token"
+API_STREAM_TASK = f"{BASE}/streaming.task"
+API_STREAM_STOP = f"{BASE}/streaming.stop"
+API_STREAM_INTERRUPT = f"{BASE}/streaming.interrupt"
+API_STREAM_START = f"{BASE}/streaming.start"  # called by the browser viewer
+
+HEADERS_XAPI = {
+    "accept": "application/json",
+    "x-api-key": os.getenv("HEYGEN_API_KEY") or "",
+    "Content-Type": "application/json",
+}
+
+
+def configure(api_key: str):
+    HEADERS_XAPI["x-api-key"] = api_key
+
+
+def _headers_bearer(tok: str):
+    return {
+        "accept": "application/json",
+        "Authorization": f"Bearer {tok}",
+        "Content-Type": "application/json",
+    }
+
+
+# ---------------- HTTP helpers ----------------
+def _endpoint(url: str) -> str:
+    return "heygen." + url.rsplit("/", 1)[-1]
+
+
+def _post_xapi(url, payload=None):
+    r = get_client().post(url, _endpoint(url), headers=HEADERS_XAPI, data=json.dumps(payload or {}))
+    try:
+        body = r.json()
+    except Exception:
+        body = {"_raw": r.text}
+    debug(f"[POST x-api] {url} -> {r.status_code}")
+    if r.status_code >= 400:
+        debug(r.text)
+        r.raise_for_status()
+    return r.status_code, body
+
+
+def _post_bearer(url, token, payload=None):
+    r = get_client().post(url, _endpoint(url), headers=_headers_bearer(token), data=json.dumps(payload or {}))
+    try:
+        body = r.json()
+    except Exception:
+        body = {"_raw": r.text}
+    debug(f"[POST bearer] {url} -> {r.status_code}")
+    if r.status_code >= 400:
+        debug(r.text)
+        r.raise_for_status()
+    return r.status_code, body
+
+
+# ---------------- HeyGen helpers ----------------
+def new_session(avatar_id: str, voice_id: Optional[str] = None):
+    payload = {"avatar_id": avatar_id}
+    if voice_id:
+        payload["voice_id"] = voice_id
+    with span("heygen_new"):
+        _, body = _post_xapi(API_STREAM_NEW, payload)
+    data = body.get("data") or {}
+    sid = data.get("session_id")
+    offer_sdp = (data.get("offer") or data.get("sdp") or {}).get("sdp")
+    ice2 = data.get("ice_servers2")
+    ice1 = data.get("ice_servers")
+    if isinstance(ice2, list) and ice2:
+        rtc_config = {"iceServers": ice2}
+    elif isinstance(ice1, list) and ice1:
+        rtc_config = {"iceServers": ice1}
+    else:
+        rtc_config = {"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
+    if not sid or not offer_sdp:
+        raise RuntimeError(f"Missing session_id or offer in response: {body}")
+    get_registry().track(sid)
+    return {"session_id": sid, "offer_sdp": offer_sdp, "rtc_config": rtc_config}
+
+
+def create_session_token(session_id: str) -> str:
+    with span("heygen_token"):
+        _, body = _post_xapi(API_CREATE_TOKEN, {"session_id": session_id})
+    tok = (body.get("data") or {}).get("token") or (body.get("data") or {}).get("access_token")
+    if not tok:
+        raise RuntimeError(f"Missing token in response: {body}")
+    get_registry().set_token(session_id, tok)
+    return tok
+
+
+def send_text_to_avatar(session_id: str, session_token: str, text: str, task_mode: str = "sync"):
+    debug(f"[avatar] speak {len(text)} chars ({task_mode})")
+    get_registry().touch(session_id)
+    with span("avatar_task", chars=len(text), mode=task_mode):
+        _post_bearer(
+            API_STREAM_TASK,
+            session_token,
+            {
+                "session_id": session_id,
+                "task_type": "repeat",
+                "task_mode": task_mode,
+                "text": text,
+            },
+        )
+
+
+def interrupt_session(session_id: str, session_token: str):
+    _post_bearer(API_STREAM_INTERRUPT, session_token, {"session_id": session_id})
+    debug("[avatar] interrupted")
+
+
+def stop_session(session_id: Optional[str], session_token: Optional[str]):
+    if not (session_id and session_token):
+        return
+    try:
+        with span("stop"):
+            _post_bearer(API_STREAM_STOP, session_token, {"session_id": session_id})
+        debug("[stop] session stopped")
+    except Exception as e:
+        debug(f"[stop_session] {e}")
+    finally:
+        get_registry().untrack(session_id)
@@ -0,0 +1,152 @@
+# Shared HTTP client for the HeyGen and OpenAI calls.
+#
+# One requests.Session per process keeps TCP+TLS connections alive across
+# Streamlit reruns and sessions. Each endpoint has its own connect/read
+# timeouts and retry policy; retries use exponential backoff with full jitter
+# and honour Retry-After. Every attempt first takes a token from the
+# process-wide rate limiter (ratelimit.py) at its endpoint's priority, and a
+# 429 pauses that endpoint's bucket. Latency is recorded per endpoint. requests is
+# imported on first use (capabilities.start() preloads it in the background),
+# so importing this module stays cheap.
+
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+from applog import debug
+from metrics import REGISTRY
+from ratelimit import get_limiter
+
+if TYPE_CHECKING:
+    import requests
+
+
+class EndpointPolicy:
+    __slots__ = ("connect_timeout", "read_timeout", "retries", "retry_statuses", "priority", "idempotent")
+
+    def __init__(self, connect_timeout: float = 3.05, read_timeout: float = 60.0, retries: int = 2,
+                 retry_statuses: tuple = (429, 500, 502, 503, 504), priority: int = 1,
+                 idempotent: bool = True):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.retry_statuses = retry_statuses
+        self.priority = priority  # rate-limit queue order, lower first
+        self.idempotent = idempotent  # False: only retry errors before the request was sent
+
+
+# streaming.new and streaming.task are not idempotent: a 5xx or a dropped
+# connection may come after HeyGen already created the session or queued the
+# speech, so they only retry refusals (429, and 503 for new) and errors while
+# connecting. Stopping frees a session (and a HEYGEN_MAX_SESSIONS slot), so it
+# goes ahead of new speech when the HeyGen bucket is busy.
+POLICIES = {
+    "heygen.streaming.new": EndpointPolicy(read_timeout=30.0, retry_statuses=(429, 503), idempotent=False),
+    "heygen.streaming.create_token": EndpointPolicy(read_timeout=15.0),
+    "heygen.streaming.task": EndpointPolicy(read_timeout=60.0, retries=1, retry_statuses=(429,), priority=2,
+                                            idempotent=False),
+    "heygen.streaming.stop": EndpointPolicy(read_timeout=15.0, priority=0),
+    "heygen.streaming.interrupt": EndpointPolicy(read_timeout=10.0, priority=0),
+    "openai.chat": EndpointPolicy(read_timeout=60.0),
+}
+DEFAULT_POLICY = EndpointPolicy(retries=1)
+
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+
+
+def _before_send(e: Exception) -> bool:
+    """True if the connection failed before any of the request reached the server."""
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+    import requests
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, (ConnectTimeoutError, NewConnectionError))
+
+
+class HttpClient:
+    def __init__(self, pool_maxsize: int = 16):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @staticmethod
+    def _record(endpoint: str, secs: float, status):
+        REGISTRY.histogram("avatharam_http_request_seconds", "Outbound HTTP latency per attempt.",
+                           endpoint=endpoint).observe(secs)
+        REGISTRY.counter("avatharam_http_responses_total", "Outbound HTTP responses by status.",
+                         endpoint=endpoint, status=status).inc()
+
+    @staticmethod
+    def _backoff(attempt: int, resp: Optional["requests.Response"]) -> float:
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_CAP)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+    def post(self, url: str, endpoint: str, **kwargs) -> "requests.Response":
+        """POST with the endpoint's timeouts and retry policy.
+
+        Connection errors and the policy's retry statuses are retried; read
+        timeouts are not, since the server may already have acted. Raises
+        ratelimit.RateLimited if no token comes within RATE_LIMIT_MAX_WAIT.
+        """
+        import requests
+        policy = POLICIES.get(endpoint, DEFAULT_POLICY)
+        kwargs.setdefault("timeout", (policy.connect_timeout, policy.read_timeout))
+        limiter = get_limiter()
+        attempt = 0
+        while True:
+            limiter.acquire(endpoint, policy.priority)
+            t0 = time.monotonic()
+            try:
+                r = self.session.post(url, **kwargs)
+            except requests.RequestException as e:
+                self._record(endpoint, time.monotonic() - t0, "error")
+                # ConnectionError covers ConnectTimeout; ReadTimeout is not retried.
+                retryable = isinstance(e, requests.ConnectionError) and (
+                    policy.idempotent or _before_send(e))
+                if not retryable or attempt >= policy.retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                debug(f"[http] {endpoint} {type(e).__name__}; retry {attempt + 1} in {delay:.2f}s")
+            else:
+                self._record(endpoint, time.monotonic() - t0, r.status_code)
+                delay = self._backoff(attempt, r)
+                if r.status_code == 429:
+                    limiter.penalise(endpoint, delay)  # everyone else waits too
+                if r.status_code not in policy.retry_statuses or attempt >= policy.retries:
+                    return r
+                debug(f"[http] {endpoint} -> {r.status_code}; retry {attempt + 1} in {delay:.2f}s")
+                r.close()
+            attempt += 1
+            time.sleep(delay)
+
+    @staticmethod
+    def stats() -> dict:
+        out = {}
+        for labels, hist in REGISTRY.members("histogram", "avatharam_http_request_seconds"):
+            out[labels["endpoint"]] = dict(hist.snapshot(), status={})
+        for labels, counter in REGISTRY.members("counter", "avatharam_http_responses_total"):
+            out.setdefault(labels["endpoint"], {"status": {}})["status"][labels["status"]] = int(counter.value)
+        return out
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
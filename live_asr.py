@@ -0,0 +1,124 @@
+# Live (incremental) transcription for the streaming capture mode.
+#
+# streamlit-webrtc hands us ~20 ms av.AudioFrames on its own thread while the
+# user is still speaking. They are resampled to 16 kHz mono s16 and fed to a
+# Vosk KaldiRecognizer chunk by chunk, so the partial transcript is always
+# current and stopping only costs FinalResult() on the last chunk instead of
+# a full recognition of the clip.
+#
+# Environment:
+#   LIVE_ASR             "1" to start in live capture mode (needs streamlit-webrtc
+#                        and VOSK_MODEL_PATH; also a sidebar toggle)
+#   LIVE_ASR_CHUNK_MS    audio batched per AcceptWaveform call   (default 100)
+#   LIVE_ASR_REFRESH     seconds between edit-box refreshes       (default 0.3)
+#   LIVE_ASR_MAX_SECS    longest utterance kept for playback      (default 120)
+
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+import capabilities
+from applog import debug
+from asr import get_vosk_model
+from audio import SAMPLE_RATE
+from tracing import span
+
+LIVE_ASR = os.getenv("LIVE_ASR", "0") == "1"
+LIVE_ASR_CHUNK_MS = int(os.getenv("LIVE_ASR_CHUNK_MS", "100"))
+LIVE_ASR_REFRESH = float(os.getenv("LIVE_ASR_REFRESH", "0.3"))
+LIVE_ASR_MAX_SECS = float(os.getenv("LIVE_ASR_MAX_SECS", "120"))
+
+_CHUNK_BYTES = SAMPLE_RATE * LIVE_ASR_CHUNK_MS // 1000 * 2
+
+
+def live_available() -> bool:
+    """streamlit-webrtc and vosk importable and a Vosk model on disk."""
+    return capabilities.has("vosk") and capabilities.has("webrtc")
+
+
+class LiveTranscriber:
+    """One per Streamlit session; on_frame is the webrtc audio_frame_callback."""
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.model_path = model_path or os.getenv("VOSK_MODEL_PATH")
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._rec = None
+        self._resampler = None
+        self._buf = bytearray()
+        self._final: list = []
+        self._partial = ""
+        self._pcm: list = []
+        self._pcm_bytes = 0
+        self.first_audio_at: Optional[float] = None
+        self.last_audio_at: Optional[float] = None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.first_audio_at is not None
+
+    def on_frame(self, frame):
+        try:
+            self._feed(frame)
+        except Exception as e:
+            debug(f"[live asr] frame dropped: {repr(e)}")
+        return frame
+
+    def _feed(self, frame):
+        import av
+        with self._lock:
+            if self._resampler is None:
+                self._resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            for out in self._resampler.resample(frame):
+                data = out.to_ndarray().reshape(-1).astype("<i2").tobytes()
+                self._buf += data
+                if self._pcm_bytes < LIVE_ASR_MAX_SECS * SAMPLE_RATE * 2:
+                    self._pcm.append(data)
+                    self._pcm_bytes += len(data)
+            now = time.monotonic()
+            if self.first_audio_at is None:
+                self.first_audio_at = now
+            self.last_audio_at = now
+            if len(self._buf) >= _CHUNK_BYTES:
+                self._accept(bytes(self._buf))
+                self._buf.clear()
+
+    def _accept(self, data: bytes):
+        # Caller holds the lock.
+        if self._rec is None:
+            from vosk import KaldiRecognizer
+            self._rec = KaldiRecognizer(get_vosk_model(self.model_path), SAMPLE_RATE)
+        if self._rec.AcceptWaveform(data):
+            text = json.loads(self._rec.Result()).get("text", "").strip()
+            if text:
+                self._final.append(text)
+            self._partial = ""
+        else:
+            self._partial = json.loads(self._rec.PartialResult()).get("partial", "").strip()
+
+    def text(self) -> str:
+        """Committed sentences plus the current partial hypothesis."""
+        with self._lock:
+            return " ".join(self._final + ([self._partial] if self._partial else []))
+
+    def finish(self) -> tuple:
+        """Close the utterance: (final transcript, 16 kHz float32 PCM); ready for the next one."""
+        with self._lock, span("live_asr_final") as attrs:
+            if self._buf:
+                self._accept(bytes(self._buf))
+            if self._rec is not None:
+                text = json.loads(self._rec.FinalResult()).get("text", "").strip()
+                if text:
+                    self._final.append(text)
+            transcript = " ".join(self._final)
+            pcm = np.frombuffer(b"".join(self._pcm), dtype="<i2").astype(np.float32) / 32768.0
+            attrs["audio_secs"] = round(pcm.size / SAMPLE_RATE, 2)
+            self._reset()
+        debug(f"[live asr] final {len(transcript)} chars from {pcm.size / SAMPLE_RATE:.2f}s")
+        return transcript, pcm
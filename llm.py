@@ -0,0 +1,479 @@
+# ChatGPT helpers for Avatharam.
+#
+# chat_completion() is the original one-shot call. stream_reply() consumes the
+# SSE token stream, cuts it at sentence boundaries and hands each sentence to
+# a speak() callback as soon as it is complete, so the avatar starts talking
+# after the first sentence instead of after the last token.
+#
+# Both go through a response cache keyed on the normalised user text, system
+# prompt, model, temperature and any conversation history (memory.py), so
+# repeated kiosk questions skip the API. Identical requests already in flight
+# (same key, e.g. the greeting from several kiosks at once) share one call.
+#
+# Environment:
+#   LLM_CACHE              "0" to bypass the response cache   (default on)
+#   LLM_CACHE_ENTRIES      replies kept                        (default 512)
+#   LLM_CACHE_TTL          seconds before a reply expires      (default 86400)
+#   LLM_CACHE_FILE         JSON file that persists the cache across restarts
+#   OPENAI_BASE_URL        API base (default https://api.openai.com/v1)
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, Iterator, Optional
+
+from applog import debug
+from cache import LRUCache, content_key
+from http_client import get_client
+from tracing import count, observe, run_in_context, span
+
+OPENAI_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/") + "/chat/completions"
+OPENAI_MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are a clear, concise assistant."
+TEMPERATURE = 0.6
+MAX_TOKENS = 600
+
+# Sentence end: terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, or a paragraph break.
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n{2,}")
+MIN_CHUNK_CHARS = 24
+
+LLM_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_ENTRIES = int(os.getenv("LLM_CACHE_ENTRIES", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE")
+SAVE_DELAY = 5.0  # seconds of new replies batched into one LLM_CACHE_FILE write
+
+
+def _headers(api_key: str) -> dict:
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+
+def _payload(user_text: str, stream: bool = False, history: Optional[list] = None) -> dict:
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *(history or []),
+            {"role": "user", "content": user_text},
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS,
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+# ---------------- Response cache ----------------
+_replies = LRUCache(LLM_CACHE_ENTRIES, ttl=LLM_CACHE_TTL)
+_replies_file_lock = threading.Lock()
+_save_timer: Optional[threading.Timer] = None
+_save_lock = threading.Lock()
+
+
+def normalise_prompt(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower().rstrip(".!?").rstrip()
+
+
+def _reply_key(user_text: str, history: Optional[list] = None) -> str:
+    parts = [normalise_prompt(user_text), SYSTEM_PROMPT, OPENAI_MODEL, TEMPERATURE]
+    if history:
+        parts.append(json.dumps(history, sort_keys=True))
+    return content_key(*parts)
+
+
+def _load_replies():
+    if not LLM_CACHE_FILE:
+        return
+    try:
+        with open(LLM_CACHE_FILE, encoding="utf-8") as f:
+            entries = json.load(f).get("entries", [])
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        debug(f"[llm cache] could not load {LLM_CACHE_FILE}: {repr(e)}")
+        return
+    now = time.time()
+    for e in entries[-LLM_CACHE_ENTRIES:]:
+        if now - e["t"] <= LLM_CACHE_TTL:
+            _replies.put(e["key"], e["reply"], stored_at=e["t"])
+    debug(f"[llm cache] loaded {len(_replies)} replies from {LLM_CACHE_FILE}")
+
+
+def _save_replies():
+    global _save_timer
+    if not LLM_CACHE_FILE:
+        return
+    with _save_lock:
+        _save_timer = None
+    entries = [{"key": k, "t": t, "reply": v} for k, t, v in _replies.items()]
+    with _replies_file_lock:
+        tmp = f"{LLM_CACHE_FILE}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(tmp, LLM_CACHE_FILE)
+        except OSError as e:
+            debug(f"[llm cache] could not save {LLM_CACHE_FILE}: {repr(e)}")
+
+
+def _schedule_save():
+    # Rewriting the whole file per reply would block the caller (the script
+    # thread, on the one-shot path); one background write covers a burst.
+    global _save_timer
+    if not LLM_CACHE_FILE:
+        return
+    with _save_lock:
+        if _save_timer is None:
+            _save_timer = threading.Timer(SAVE_DELAY, _save_replies)
+            _save_timer.daemon = True
+            _save_timer.start()
+
+
+def flush_replies():
+    """Write pending replies now (at exit)."""
+    with _save_lock:
+        timer = _save_timer
+    if timer is not None:
+        timer.cancel()
+        _save_replies()
+
+
+def cached_reply(user_text: str, history: Optional[list] = None) -> Optional[str]:
+    reply = _replies.get(_reply_key(user_text, history))
+    count("avatharam_llm_cache_total", "ChatGPT reply cache lookups.", result="miss" if reply is None else "hit")
+    if reply is not None:
+        debug("[llm cache] hit")
+    return reply
+
+
+def remember_reply(user_text: str, reply: str, history: Optional[list] = None):
+    if not reply:
+        return
+    _replies.put(_reply_key(user_text, history), reply)
+    _schedule_save()
+
+
+def cache_stats() -> dict:
+    return _replies.stats()
+
+
+_load_replies()
+atexit.register(flush_replies)
+
+
+# ---------------- Coalescing ----------------
+# Keyed like the reply cache and only for callers that accept cached replies,
+# since a follower gets the leader's answer.
+_flights: dict = {}
+_flights_lock = threading.Lock()
+
+
+def _coalesced(mode: str):
+    count("avatharam_llm_coalesced_total", "Requests answered by an identical one already in flight.", mode=mode)
+
+
+# ---------------- One-shot ----------------
+def chat_completion(api_key: str, user_text: str, use_cache: bool = LLM_CACHE, history: Optional[list] = None) -> str:
+    if not use_cache:
+        return _chat_completion(api_key, user_text, False, history)
+    reply = cached_reply(user_text, history)
+    if reply is not None:
+        return reply
+    key = "oneshot:" + _reply_key(user_text, history)
+    with _flights_lock:
+        fut = _flights.get(key)
+        leader = fut is None
+        if leader:
+            fut = _flights[key] = Future()
+    if not leader:
+        _coalesced("oneshot")
+        return fut.result()
+    try:
+        reply = _chat_completion(api_key, user_text, True, history)
+        fut.set_result(reply)
+        return reply
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+
+
+def _chat_completion(api_key: str, user_text: str, use_cache: bool, history: Optional[list]) -> str:
+    with span("llm", mode="oneshot"):
+        r = get_client().post(OPENAI_URL, "openai.chat", headers=_headers(api_key),
+                              data=json.dumps(_payload(user_text, history=history)))
+        debug(f"[openai] status {r.status_code}")
+        r.raise_for_status()
+        body = r.json()
+    reply = (body.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+    if not reply:
+        debug(f"[openai] empty reply: {body}")
+    elif use_cache:
+        remember_reply(user_text, reply, history)
+    return reply
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a visitor and an assistant. "
+    "Update the summary with the new turns. Keep names, facts, preferences and open questions; "
+    "drop greetings and small talk. Reply with the summary only, at most {words} words."
+)
+
+
+def summarise(api_key: str, summary: str, turns: list, max_tokens: int) -> str:
+    """Fold ``turns`` (chat messages) into ``summary``; one uncached call."""
+    lines = [f"{m['role'].capitalize()}: {m['content']}" for m in turns]
+    prompt = (f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n" + "\n".join(lines))
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT.format(words=max(20, int(max_tokens * 0.75)))},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens,
+    }
+    with span("llm_summary", turns=len(turns)):
+        r = get_client().post(OPENAI_URL, "openai.chat", headers=_headers(api_key), data=json.dumps(payload))
+        r.raise_for_status()
+        body = r.json()
+    return (body.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+
+
+# ---------------- Streaming ----------------
+def stream_chat_completion(api_key: str, user_text: str, history: Optional[list] = None) -> Iterator[str]:
+    """Yield content deltas from the chat/completions SSE stream."""
+    with get_client().post(
+        OPENAI_URL,
+        "openai.chat",
+        headers=_headers(api_key),
+        data=json.dumps(_payload(user_text, stream=True, history=history)),
+        stream=True,
+    ) as r:
+        debug(f"[openai] stream status {r.status_code}")
+        if r.status_code >= 400:
+            debug(r.text)
+            r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            except (ValueError, KeyError, IndexError):
+                continue
+            if delta:
+                yield delta
+
+
+def iter_sentences(tokens: Iterable[str], min_chars: int = MIN_CHUNK_CHARS) -> Iterator[str]:
+    """Re-chunk a token stream into sentences of at least ``min_chars``."""
+    buf = ""
+    for tok in tokens:
+        buf += tok
+        while True:
+            cut = next((m for m in _SENTENCE_END.finditer(buf) if m.start() >= min_chars), None)
+            if cut is None:
+                break
+            chunk, buf = buf[:cut.end()].strip(), buf[cut.end():]
+            if chunk:
+                yield chunk
+    if buf.strip():
+        yield buf.strip()
+
+
+class _Flight:
+    """One streamed reply, read by every identical stream_reply() in flight."""
+    __slots__ = ("key", "sentences", "done", "cut", "error", "first_token_at", "readers", "cond")
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.sentences: list = []
+        self.done = False
+        self.cut = False            # stopped early because every reader cancelled
+        self.error: Optional[Exception] = None
+        self.first_token_at: Optional[float] = None
+        self.readers = 1
+        self.cond = threading.Condition()
+
+
+def _join_flight(key: Optional[str]) -> tuple:
+    """(flight, True if the caller must start it)."""
+    if key is None:
+        return _Flight(None), True
+    key = "stream:" + key
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            with flight.cond:
+                if flight.readers > 0:  # not already being abandoned
+                    flight.readers += 1
+                    return flight, False
+        flight = _flights[key] = _Flight(key)
+        return flight, True
+
+
+def _leave_flight(flight: _Flight):
+    with flight.cond:
+        flight.readers -= 1
+        abandoned = flight.readers == 0 and not flight.done
+    if abandoned and flight.key is not None:
+        with _flights_lock:
+            if _flights.get(flight.key) is flight:
+                _flights.pop(flight.key)
+
+
+def _produce(flight: _Flight, api_key: str, user_text: str, history: Optional[list], use_cache: bool):
+    def _tokens():
+        for tok in stream_chat_completion(api_key, user_text, history):
+            if flight.readers == 0:
+                flight.cut = True
+                return  # closing the generator closes the HTTP response
+            if flight.first_token_at is None:
+                flight.first_token_at = time.monotonic()
+            yield tok
+
+    try:
+        for sentence in iter_sentences(_tokens()):
+            with flight.cond:
+                flight.sentences.append(sentence)
+                flight.cond.notify_all()
+    except Exception as e:
+        flight.error = e
+    finally:
+        if use_cache and flight.error is None and not flight.cut:
+            remember_reply(user_text, " ".join(flight.sentences).strip(), history)
+        if flight.key is not None:
+            with _flights_lock:
+                if _flights.get(flight.key) is flight:
+                    _flights.pop(flight.key)
+        with flight.cond:
+            flight.done = True
+            flight.cond.notify_all()
+
+
+def time_first_speech(spoken, timings: dict, t0: float):
+    """Set timings["first_speech"] once the avatar accepts the first sentence.
+
+    speech_queue.speak() returns a Future that resolves when the sentence's
+    streaming.task is accepted; other speak callbacks leave first_speech unset.
+    """
+    if not isinstance(spoken, Future):
+        return
+
+    def _accepted(f: Future):
+        if not f.cancelled() and f.exception() is None:
+            timings["first_speech"] = f.result() - t0
+            observe("llm_first_speech", timings["first_speech"])
+
+    spoken.add_done_callback(_accepted)
+
+
+def stream_reply(api_key: str, user_text: str, speak: Optional[Callable[[str], object]] = None,
+                 use_cache: bool = LLM_CACHE, cancel: Optional[threading.Event] = None,
+                 history: Optional[list] = None) -> tuple[str, dict]:
+    """Stream a reply, speaking each sentence as it completes.
+
+    The SSE stream is read on a background thread so token generation keeps
+    going while speak() is busy with the previous sentence; with use_cache an
+    identical request already streaming is joined instead of sent again
+    (timings["coalesced"]). Returns the full reply and timings in seconds
+    (first_token, first_sentence, first_speech, total). first_sentence is when
+    the first sentence was handed to speak(); first_speech is when its
+    streaming.task was accepted, filled in later by the speech worker when
+    speak() returns a Future (speech_queue.speak). Setting ``cancel`` stops
+    speaking at once and, when no other caller shares the stream, closes it
+    at the next token; the partial reply is returned with timings["cancelled"]
+    and not cached.
+    """
+    t0 = time.monotonic()
+    timings = {"first_token": None, "first_sentence": None, "first_speech": None, "total": None, "chunks": 0,
+               "cached": False, "coalesced": False, "cancelled": False}
+    cancel = cancel or threading.Event()
+    if use_cache:
+        reply = cached_reply(user_text, history)
+        if reply is not None:
+            timings["cached"] = True
+            timings["first_token"] = time.monotonic() - t0
+            if speak is not None:
+                timings["first_sentence"] = timings["first_token"]
+                for sentence in iter_sentences([reply]):
+                    if cancel.is_set():
+                        timings["cancelled"] = True
+                        break
+                    timings["chunks"] += 1
+                    spoken = speak(sentence)
+                    if timings["chunks"] == 1:
+                        time_first_speech(spoken, timings, t0)
+            timings["total"] = time.monotonic() - t0
+            return reply, timings
+    key = _reply_key(user_text, history) if use_cache else None
+    flight, leader = _join_flight(key)
+    if leader:
+        threading.Thread(target=run_in_context(_produce, flight, api_key, user_text, history, use_cache),
+                         name="openai-stream", daemon=True).start()
+    else:
+        timings["coalesced"] = True
+        _coalesced("stream")
+
+    parts = []
+    try:
+        while not timings["cancelled"]:
+            with flight.cond:
+                if len(flight.sentences) == len(parts) and not flight.done:
+                    flight.cond.wait(0.1)
+                new, done = flight.sentences[len(parts):], flight.done
+            if timings["first_token"] is None and flight.first_token_at is not None:
+                timings["first_token"] = max(0.0, flight.first_token_at - t0)
+            for item in new:
+                if cancel.is_set():
+                    break
+                parts.append(item)
+                timings["chunks"] += 1
+                if speak is not None:
+                    first = timings["first_sentence"] is None
+                    if first:
+                        timings["first_sentence"] = time.monotonic() - t0
+                    try:
+                        spoken = speak(item)
+                        if first:
+                            time_first_speech(spoken, timings, t0)
+                    except Exception as e:
+                        debug(f"[openai stream] speak failed: {repr(e)}")
+                        speak = None
+            timings["cancelled"] = cancel.is_set()
+            if done and not timings["cancelled"]:
+                break
+    finally:
+        _leave_flight(flight)
+    error = flight.error
+    timings["total"] = time.monotonic() - t0
+    if timings["cancelled"]:
+        count("avatharam_llm_cancelled_total", "Streamed replies cancelled before completion.")
+        debug(f"[openai stream] cancelled after {timings['chunks']} chunks, {timings['total']:.2f}s")
+        return " ".join(parts).strip(), timings
+    observe("llm", timings["total"], mode="stream")
+    if timings["first_sentence"] is not None:
+        observe("llm_first_sentence", timings["first_sentence"])
+    if error is not None:
+        count("avatharam_stage_errors_total", "Stage failures.", stage="llm")
+        if not parts:
+            raise error
+        debug(f"[openai stream] truncated: {repr(error)}")
+    reply = " ".join(parts).strip()
+    first = timings["first_sentence"]
+    debug(
+        f"[openai stream] {timings['chunks']} chunks, "
+        f"first_sentence={'-' if first is None else f'{first:.2f}s'}, total={timings['total']:.2f}s"
+    )
+    return reply, timings
@@ -0,0 +1,164 @@
+# Per-visitor conversation memory for ChatGPT turns.
+#
+# Each Streamlit session keeps one Conversation. history() returns the newest
+# turns that fit MEMORY_PROMPT_TOKENS, behind a rolling summary of everything
+# older, so the prompt stays bounded however long the visit runs. Turns that
+# fall out of that window are folded into the summary by fold() on a
+# background thread once a reply is done: the previous summary and only the
+# evicted turns go in, never the whole transcript. Until a fold lands, evicted
+# turns are simply left out of the prompt.
+#
+# Tokens are counted with tiktoken when it is installed, otherwise estimated
+# at four characters per token.
+#
+# Environment:
+#   LLM_MEMORY              "1" sends earlier turns with each request
+#                           (default off: a history is part of the reply
+#                           cache key, so only a conversation's first
+#                           message can hit the cache or share a request)
+#   MEMORY_PROMPT_TOKENS    summary + history tokens per request (default 1200)
+#   MEMORY_SUMMARY_TOKENS   longest rolling summary              (default 200)
+
+import os
+import threading
+from typing import Optional
+
+import capabilities
+from applog import debug
+from llm import OPENAI_MODEL, summarise
+from tracing import count, run_in_context
+
+LLM_MEMORY = os.getenv("LLM_MEMORY", "0") == "1"
+MEMORY_PROMPT_TOKENS = int(os.getenv("MEMORY_PROMPT_TOKENS", "1200"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))
+
+MESSAGE_OVERHEAD = 4   # role and separators per chat message
+MAX_TURNS = 64         # kept even if folding keeps failing
+
+
+# ---------------- Token counting ----------------
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoder
+    if _encoder is None:
+        _encoder = False
+        if capabilities.has("tiktoken"):
+            try:
+                import tiktoken
+                _encoder = tiktoken.encoding_for_model(OPENAI_MODEL)
+            except Exception as e:
+                debug(f"[memory] tiktoken unavailable, estimating: {repr(e)}")
+    if _encoder:
+        return len(_encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+class Turn:
+    __slots__ = ("user", "assistant", "tokens")
+
+    def __init__(self, user: str, assistant: str):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = count_tokens(user) + count_tokens(assistant) + 2 * MESSAGE_OVERHEAD
+
+    def messages(self) -> list:
+        return [{"role": "user", "content": self.user}, {"role": "assistant", "content": self.assistant}]
+
+
+# ---------------- Conversation ----------------
+class Conversation:
+    def __init__(self, budget: int = MEMORY_PROMPT_TOKENS, summary_tokens: int = MEMORY_SUMMARY_TOKENS):
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.folds = 0
+        self._summary_cost = 0
+        self._turns: list = []
+        self._folding = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _window_locked(self) -> int:
+        # Index of the oldest turn that still fits beside the summary.
+        room = self.budget - self._summary_cost
+        start = len(self._turns)
+        while start > 0 and self._turns[start - 1].tokens <= room:
+            room -= self._turns[start - 1].tokens
+            start -= 1
+        return start
+
+    def history(self) -> list:
+        """Chat messages to send before the new user message."""
+        with self._lock:
+            msgs = []
+            if self.summary:
+                msgs.append({"role": "system", "content": f"Earlier in this conversation: {self.summary}"})
+            for turn in self._turns[self._window_locked():]:
+                msgs.extend(turn.messages())
+            return msgs
+
+    def add(self, user_text: str, reply: str):
+        with self._lock:
+            self._turns.append(Turn(user_text.strip(), reply.strip()))
+            if len(self._turns) > MAX_TURNS:
+                del self._turns[:len(self._turns) - MAX_TURNS]
+
+    def fold(self, api_key: str, background: bool = True) -> bool:
+        """Summarise turns that no longer fit; False when there is nothing to do."""
+        with self._lock:
+            if self._folding or not api_key:
+                return False
+            evicted = self._turns[:self._window_locked()]
+            if not evicted:
+                return False
+            self._folding = True
+            summary, generation = self.summary, self._generation
+        if not background:
+            self._fold(api_key, summary, evicted, generation)
+            return True
+        threading.Thread(target=run_in_context(self._fold, api_key, summary, evicted, generation),
+                         name="memory-fold", daemon=True).start()
+        return True
+
+    def _fold(self, api_key: str, summary: str, evicted: list, generation: int):
+        new = ""
+        try:
+            msgs = [m for turn in evicted for m in turn.messages()]
+            new = summarise(api_key, summary, msgs, self.summary_tokens)
+        except Exception as e:
+            debug(f"[memory] summary failed: {repr(e)}")
+        with self._lock:
+            self._folding = False
+            if generation != self._generation:
+                return  # cleared meanwhile
+            if not new:
+                count("avatharam_memory_folds_total", "Rolling summary updates.", result="error")
+                return
+            self.summary = new
+            self._summary_cost = count_tokens(new) + MESSAGE_OVERHEAD
+            # Only the turns that were summarised; replies added meanwhile stay.
+            self._turns = [t for t in self._turns if all(t is not e for e in evicted)]
+            self.folds += 1
+        count("avatharam_memory_folds_total", "Rolling summary updates.", result="ok")
+        debug(f"[memory] folded {len(evicted)} turns into a {self._summary_cost}-token summary")
+
+    def clear(self):
+        with self._lock:
+            self._turns = []
+            self._generation += 1
+            self.summary = ""
+            self._summary_cost = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            start = self._window_locked()
+            return {"turns": len(self._turns), "in_prompt": len(self._turns) - start,
+                    "prompt_tokens": self._summary_cost + sum(t.tokens for t in self._turns[start:]),
+                    "summary_tokens": self._summary_cost, "folds": self.folds}
+
+
+def new_conversation() -> Optional[Conversation]:
+    """A Conversation, or None when LLM_MEMORY is off."""
+    return Conversation() if LLM_MEMORY else None
@@ -0,0 +1,149 @@
+# In-process metrics shared by the Avatharam helper modules.
+#
+# Everything registers in REGISTRY, which tracing.py serves in the Prometheus
+# text format when METRICS_PORT is set.
+
+import bisect
+import threading
+from typing import Optional, Sequence
+
+# Seconds; covers sub-ms cache hits up to slow LLM / avatar calls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; cheap enough to update on every call."""
+
+    def __init__(self, buckets: Optional[Sequence[float]] = None):
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            counts, total = list(self._counts), self._count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, s = list(self._counts), self._count, self._sum
+        cumulative, acc = [], 0
+        for le, c in zip(self.buckets + (float("inf"),), counts):
+            acc += c
+            cumulative.append((le, acc))
+        return {
+            "count": total,
+            "sum": s,
+            "buckets": cumulative,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+# ---------------- Registry ----------------
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Registry:
+    """Named, labelled metrics; rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict = {}  # (kind, name) -> {labels_tuple: metric}
+        self._help: dict = {}
+
+    def _get(self, kind: str, cls, name: str, help_text: str, labels: dict):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._metrics.setdefault((kind, name), {})
+            metric = family.get(key)
+            if metric is None:
+                metric = family[key] = cls()
+                if help_text:
+                    self._help.setdefault(name, help_text)
+            return metric
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._get("histogram", Histogram, name, help_text, labels)
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get("counter", Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get("gauge", Gauge, name, help_text, labels)
+
+    def members(self, kind: str, name: str) -> list:
+        """[(labels_dict, metric)] for one metric family."""
+        with self._lock:
+            return [(dict(k), m) for k, m in self._metrics.get((kind, name), {}).items()]
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            families = [(kind, name, list(m.items())) for (kind, name), m in sorted(self._metrics.items())]
+        lines = []
+        for kind, name, members in families:
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in members:
+                if kind == "histogram":
+                    snap = metric.snapshot()
+                    for le, count in snap["buckets"]:
+                        le_s = "+Inf" if le == float("inf") else repr(le)
+                        lines.append(f"{name}_bucket{_label_str(labels + (('le', le_s),))} {count}")
+                    lines.append(f"{name}_sum{_label_str(labels)} {snap['sum']}")
+                    lines.append(f"{name}_count{_label_str(labels)} {snap['count']}")
+                else:
+                    lines.append(f"{name}{_label_str(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
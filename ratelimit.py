@@ -0,0 +1,172 @@
+# Process-wide rate limiting for outbound HeyGen and OpenAI calls.
+#
+# Every request attempt takes a token from its endpoint's bucket before it is
+# sent, so a burst from many sessions queues here instead of coming back as
+# 429s. Waiters are served by priority, then arrival: stop and interrupt
+# first, then session set-up and chat, then new speech tasks (see
+# http_client.POLICIES). A 429 empties the bucket for its Retry-After, so all
+# sessions back off together instead of each retrying into the limit.
+#
+# Environment:
+#   RATE_LIMITS          endpoint=rate[/burst],... requests per second; a
+#                        prefix such as "heygen" is one bucket for every
+#                        heygen.* endpoint without its own entry, "" = off
+#                        (default "openai=8/16,heygen=10/20")
+#   RATE_LIMIT_MAX_WAIT  seconds a request may queue before RateLimited (default 30)
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Optional
+
+from applog import debug
+from metrics import REGISTRY
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "openai=8/16,heygen=10/20")
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+
+
+class RateLimited(RuntimeError):
+    """A request waited longer than RATE_LIMIT_MAX_WAIT for its turn."""
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: list = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill_locked(self, now: float):
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def _ready_locked(self, now: float) -> bool:
+        return self.tokens >= 1 and now >= self._blocked_until
+
+    def acquire(self, priority: int = 1, timeout: Optional[float] = RATE_LIMIT_MAX_WAIT) -> float:
+        """Take one token, waiting behind higher-priority and earlier callers; returns the wait."""
+        t0 = time.monotonic()
+        with self._cond:
+            self._refill_locked(t0)
+            if not self._waiters and self._ready_locked(t0):
+                self.tokens -= 1
+                return 0.0
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            self._gauge_locked()
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill_locked(now)
+                    if self._waiters[0] == ticket and self._ready_locked(now):
+                        self.tokens -= 1
+                        break
+                    remaining = None if timeout is None else t0 + timeout - now
+                    if remaining is not None and remaining <= 0:
+                        raise RateLimited(f"{self.name}: waited {now - t0:.1f}s, {len(self._waiters) - 1} ahead")
+                    # Next token (or end of a 429 pause); earlier turns are woken by notify.
+                    nap = max(self._blocked_until - now, (1 - self.tokens) / self.rate, 0.001)
+                    self._cond.wait(nap if remaining is None else min(nap, remaining))
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                self._gauge_locked()
+        return time.monotonic() - t0
+
+    def penalise(self, secs: float):
+        """The server said 429: nothing leaves this bucket for ``secs``."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill_locked(now)
+            self.tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + secs)
+        debug(f"[ratelimit] {self.name} paused {secs:.2f}s after 429")
+
+    def _gauge_locked(self):
+        REGISTRY.gauge("avatharam_rate_limit_waiters", "Requests queued for a rate-limit token.",
+                       bucket=self.name).set(len(self._waiters))
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill_locked(time.monotonic())
+            return {"rate": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2),
+                    "waiting": len(self._waiters)}
+
+
+def parse_limits(spec: str) -> dict:
+    """"openai=8/16,heygen=10" -> {"openai": (8.0, 16.0), "heygen": (10.0, 10.0)}."""
+    limits = {}
+    for item in (s.strip() for s in spec.split(",")):
+        if not item:
+            continue
+        try:
+            key, value = item.split("=", 1)
+            rate, _, burst = value.partition("/")
+            limits[key.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            debug(f"[ratelimit] ignoring bad RATE_LIMITS entry {item!r}")
+    return {k: v for k, v in limits.items() if v[0] > 0}
+
+
+class RateLimiter:
+    def __init__(self, limits: Optional[dict] = None):
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else limits
+        self._buckets: dict = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint: str) -> Optional[TokenBucket]:
+        """The bucket for ``endpoint``: its own entry, else its longest configured prefix."""
+        key = endpoint
+        while key not in self.limits:
+            if "." not in key:
+                return None
+            key = key.rsplit(".", 1)[0]
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = TokenBucket(key, *self.limits[key])
+            return b
+
+    def acquire(self, endpoint: str, priority: int = 1, timeout: Optional[float] = RATE_LIMIT_MAX_WAIT) -> float:
+        b = self.bucket(endpoint)
+        if b is None:
+            return 0.0
+        wait = b.acquire(priority, timeout)
+        REGISTRY.histogram("avatharam_rate_limit_wait_seconds", "Time queued for a rate-limit token.",
+                           endpoint=endpoint).observe(wait)
+        if wait > 1.0:
+            debug(f"[ratelimit] {endpoint} waited {wait:.2f}s")
+        return wait
+
+    def penalise(self, endpoint: str, secs: float):
+        b = self.bucket(endpoint)
+        if b is not None:
+            b.penalise(secs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {b.name: b.stats() for b in buckets}
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,188 @@
+# Pre-warmed HeyGen streaming sessions.
+#
+# streaming.new + streaming.create_token + the ready delay cost seconds on the
+# page's critical path. The pool keeps a few ready sessions per avatar, refills
+# them on a background thread and stops any that get too old to be started
+# before HeyGen times them out, so a new visitor is handed one instantly.
+#
+# Environment:
+#   HEYGEN_POOL_SIZE       ready sessions to keep per avatar   (default 0 = off)
+#   HEYGEN_POOL_MAX_AGE    discard a pooled session after secs (default 90)
+#   HEYGEN_READY_DELAY     wait after create before viewer use (default 1.0)
+#
+# Sessions count against HEYGEN_MAX_SESSIONS (session_registry.py); refills
+# only take a slot when it is free and no visitor is waiting for one.
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from applog import debug
+from heygen import create_session_token, new_session, stop_session
+from session_registry import HEYGEN_SLOT_WAIT, SessionLimitReached, get_registry
+from tracing import count
+
+HEYGEN_POOL_SIZE = int(os.getenv("HEYGEN_POOL_SIZE", "0"))
+HEYGEN_POOL_MAX_AGE = float(os.getenv("HEYGEN_POOL_MAX_AGE", "90"))
+HEYGEN_READY_DELAY = float(os.getenv("HEYGEN_READY_DELAY", "1.0"))
+
+
+def create_ready_session(avatar_id: str, voice_id: Optional[str] = None, wait_ready: bool = True,
+                         slot_wait: float = HEYGEN_SLOT_WAIT) -> dict:
+    """streaming.new + create_token; returns session_id/session_token/offer_sdp/rtc_config/created_at.
+
+    Waits up to slot_wait for a free session slot (SessionLimitReached otherwise).
+    """
+    registry = get_registry()
+    registry.reserve(timeout=slot_wait)
+    try:
+        created = new_session(avatar_id, voice_id)
+    except Exception:
+        registry.release()
+        raise
+    try:
+        created["session_token"] = create_session_token(created["session_id"])
+    except Exception:
+        registry.untrack(created["session_id"])  # cannot be stopped without a token
+        raise
+    created["created_at"] = time.monotonic()
+    if wait_ready:
+        time.sleep(HEYGEN_READY_DELAY)
+    return created
+
+
+class SessionPool:
+    def __init__(self, avatar_id: str, voice_id: Optional[str] = None,
+                 size: int = HEYGEN_POOL_SIZE, max_age: float = HEYGEN_POOL_MAX_AGE):
+        self.avatar_id = avatar_id
+        self.voice_id = voice_id
+        self.size = size
+        self.max_age = max_age
+        self._ready: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._failures = 0
+        self.hits = 0
+        self.misses = 0
+        self._thread = threading.Thread(target=self._run, name=f"heygen-pool-{avatar_id}", daemon=True)
+        self._thread.start()
+
+    def _is_fresh(self, s: dict, now: float) -> bool:
+        return now - s["created_at"] < self.max_age and get_registry().alive(s["session_id"])
+
+    def acquire(self) -> Optional[dict]:
+        """Pop the oldest fresh session, or None if the pool is empty (caller creates one)."""
+        now = time.monotonic()
+        with self._cond:
+            while self._ready:
+                s = self._ready.popleft()
+                if self._is_fresh(s, now):
+                    self.hits += 1
+                    self._cond.notify_all()
+                    debug(f"[pool] handed out {s['session_id'][:8]}... ({len(self._ready)} left)")
+                    return s
+                threading.Thread(target=stop_session, args=(s["session_id"], s["session_token"]), daemon=True).start()
+            self.misses += 1
+            self._cond.notify_all()
+        return None
+
+    def _prune(self):
+        now = time.monotonic()
+        with self._cond:
+            stale = [s for s in self._ready if not self._is_fresh(s, now)]
+            for s in stale:
+                self._ready.remove(s)
+        for s in stale:
+            debug(f"[pool] expiring {s['session_id'][:8]}...")
+            stop_session(s["session_id"], s["session_token"])
+
+    def _run(self):
+        while True:
+            self._prune()
+            with self._cond:
+                if self._closed:
+                    return
+                need = len(self._ready) < self.size
+            if need:
+                try:
+                    s = create_ready_session(self.avatar_id, self.voice_id, wait_ready=False, slot_wait=0)
+                except SessionLimitReached:
+                    pass  # visitors come first; retry after the usual wait
+                except Exception as e:
+                    self._failures += 1
+                    debug(f"[pool] refill failed ({self._failures}): {repr(e)}")
+                else:
+                    self._failures = 0
+                    with self._cond:
+                        closed = self._closed
+                        if not closed:
+                            self._ready.append(s)
+                    if closed:
+                        stop_session(s["session_id"], s["session_token"])
+                        return
+                    debug(f"[pool] ready {s['session_id'][:8]}... ({len(self._ready)}/{self.size})")
+                    continue
+            # Sleep until someone takes a session, the oldest one needs
+            # expiring, or (after failures) the backoff elapses.
+            wait = min(5.0, self.max_age / 4)
+            if self._failures:
+                wait = min(60.0, 2.0 ** self._failures)
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(timeout=wait)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            drained = list(self._ready)
+            self._ready.clear()
+            self._cond.notify_all()
+        for s in drained:
+            stop_session(s["session_id"], s["session_token"])
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"ready": len(self._ready), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(avatar_id: str, voice_id: Optional[str] = None) -> Optional[SessionPool]:
+    """Process-wide pool for this avatar/voice, started on first use; None when disabled."""
+    if HEYGEN_POOL_SIZE <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get((avatar_id, voice_id))
+        if pool is None:
+            pool = _pools[(avatar_id, voice_id)] = SessionPool(avatar_id, voice_id)
+        return pool
+
+
+def acquire_session(avatar_id: str, voice_id: Optional[str] = None, slot_wait: float = HEYGEN_SLOT_WAIT) -> dict:
+    """A ready session: from the pool when possible, otherwise created inline."""
+    pool = get_pool(avatar_id, voice_id)
+    s = pool.acquire() if pool else None
+    count("avatharam_session_acquire_total", "Session hand-outs by source.", source="create" if s is None else "pool")
+    if s is None:
+        return create_ready_session(avatar_id, voice_id, slot_wait=slot_wait)
+    get_registry().touch(s["session_id"])
+    remaining = HEYGEN_READY_DELAY - (time.monotonic() - s["created_at"])
+    if remaining > 0:
+        time.sleep(remaining)
+    return s
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
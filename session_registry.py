@@ -0,0 +1,196 @@
+# Process-wide registry of live HeyGen sessions.
+#
+# heygen.new_session / create_session_token / send_text_to_avatar /
+# stop_session report here, so every session this process created is known
+# no matter which Streamlit session (or pool) owns it. A reaper thread stops
+# sessions with no activity for HEYGEN_SESSION_IDLE_SECS; app reruns count as
+# activity, and an open viewer reruns every VIEWER_STATS_SECS, so only closed
+# tabs go idle. HEYGEN_MAX_SESSIONS caps concurrent sessions: creators
+# reserve a slot first and wait in FIFO order when none is free.
+#
+# Environment:
+#   HEYGEN_MAX_SESSIONS       concurrent sessions allowed          (default 0 = no cap)
+#   HEYGEN_SESSION_IDLE_SECS  stop a session idle this long        (default 300, 0 = never)
+#   HEYGEN_SLOT_WAIT          seconds a visitor waits for a slot   (default 20)
+#   HEYGEN_SLOT_POLL          seconds between the app's retries while all slots
+#                             are taken at auto-start              (default 3)
+
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from applog import debug
+from metrics import REGISTRY
+from tracing import count, observe
+
+HEYGEN_MAX_SESSIONS = int(os.getenv("HEYGEN_MAX_SESSIONS", "0"))
+HEYGEN_SESSION_IDLE_SECS = float(os.getenv("HEYGEN_SESSION_IDLE_SECS", "300"))
+HEYGEN_SLOT_WAIT = float(os.getenv("HEYGEN_SLOT_WAIT", "20"))
+HEYGEN_SLOT_POLL = float(os.getenv("HEYGEN_SLOT_POLL", "3"))
+
+
+class SessionLimitReached(RuntimeError):
+    """No session slot became free within the wait."""
+
+
+class _Tracked:
+    __slots__ = ("session_id", "session_token", "created_at", "last_active")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.session_token: Optional[str] = None
+        self.created_at = self.last_active = time.monotonic()
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions: int = HEYGEN_MAX_SESSIONS, idle_secs: float = HEYGEN_SESSION_IDLE_SECS):
+        self.max_sessions = max_sessions
+        self.idle_secs = idle_secs
+        self._sessions: dict = {}
+        self._reserved = 0
+        self._waiters: deque = deque()
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+        self.reaped = 0
+        self.rejected = 0
+
+    # ---- slots ----
+    def _free_locked(self) -> bool:
+        return self.max_sessions <= 0 or len(self._sessions) + self._reserved < self.max_sessions
+
+    def reserve(self, timeout: Optional[float] = HEYGEN_SLOT_WAIT):
+        """Hold a slot for a session about to be created; FIFO, raises SessionLimitReached.
+
+        timeout=0 never waits and never jumps ahead of waiting visitors (pool refills).
+        """
+        t0 = time.monotonic()
+        with self._cond:
+            if self.max_sessions <= 0:
+                self._reserved += 1
+                return
+            if not self._waiters and self._free_locked():
+                self._reserved += 1
+                return
+            if not timeout:
+                raise SessionLimitReached(f"{self.max_sessions} sessions in use")
+            ticket = next(self._tickets)
+            self._waiters.append(ticket)
+            self._gauges_locked()
+            try:
+                deadline = t0 + timeout
+                while not (self._waiters[0] == ticket and self._free_locked()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        count("avatharam_session_slot_rejected_total", "Visitors who gave up waiting for a session slot.")
+                        raise SessionLimitReached(
+                            f"{self.max_sessions} sessions in use, {len(self._waiters) - 1} others waiting")
+                    self._cond.wait(timeout=remaining)
+                self._reserved += 1
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+                self._gauges_locked()
+        observe("session_slot_wait", time.monotonic() - t0)
+
+    def release(self):
+        """Give back a reserved slot whose session was never created."""
+        with self._cond:
+            self._reserved = max(0, self._reserved - 1)
+            self._cond.notify_all()
+
+    # ---- lifecycle ----
+    def track(self, session_id: str):
+        with self._cond:
+            if self._reserved:
+                self._reserved -= 1
+            self._sessions[session_id] = _Tracked(session_id)
+            self._gauges_locked()
+            if self._reaper is None and self.idle_secs > 0:
+                self._reaper = threading.Thread(target=self._reap_loop, name="heygen-reaper", daemon=True)
+                self._reaper.start()
+
+    def set_token(self, session_id: str, session_token: str):
+        with self._cond:
+            s = self._sessions.get(session_id)
+            if s is not None:
+                s.session_token = session_token
+                s.last_active = time.monotonic()
+
+    def touch(self, session_id: Optional[str]):
+        s = self._sessions.get(session_id) if session_id else None
+        if s is not None:
+            s.last_active = time.monotonic()
+
+    def untrack(self, session_id: Optional[str]):
+        with self._cond:
+            if self._sessions.pop(session_id, None) is not None:
+                self._cond.notify_all()
+                self._gauges_locked()
+
+    def alive(self, session_id: Optional[str]) -> bool:
+        return bool(session_id) and session_id in self._sessions
+
+    # ---- reaping ----
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(max(1.0, min(30.0, self.idle_secs / 4)))
+            self.reap()
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Stop every session idle longer than idle_secs; returns how many."""
+        if self.idle_secs <= 0:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._cond:
+            idle = [s for s in self._sessions.values() if now - s.last_active > self.idle_secs]
+        for s in idle:
+            debug(f"[registry] reaping {s.session_id[:8]}... idle {now - s.last_active:.0f}s")
+            self._stop(s)
+        self.reaped += len(idle)
+        if idle:
+            count("avatharam_sessions_reaped_total", "Idle HeyGen sessions stopped by the reaper.")
+        return len(idle)
+
+    def _stop(self, s: _Tracked):
+        from heygen import stop_session  # heygen imports this module
+        if s.session_token:
+            stop_session(s.session_id, s.session_token)
+        self.untrack(s.session_id)
+
+    def stop_all(self, timeout: float = 10.0):
+        """Stop every tracked session in parallel (shutdown)."""
+        self._closed = True
+        with self._cond:
+            sessions = list(self._sessions.values())
+        threads = [threading.Thread(target=self._stop, args=(s,), daemon=True) for s in sessions]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        if sessions:
+            debug(f"[registry] stopped {len(sessions)} sessions at shutdown")
+
+    def _gauges_locked(self):
+        REGISTRY.gauge("avatharam_heygen_sessions", "Live HeyGen sessions tracked by this process.").set(len(self._sessions))
+        REGISTRY.gauge("avatharam_session_slot_waiters", "Visitors waiting for a session slot.").set(len(self._waiters))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"sessions": len(self._sessions), "reserved": self._reserved, "waiting": len(self._waiters),
+                    "max": self.max_sessions, "reaped": self.reaped, "rejected": self.rejected}
+
+
+_registry = SessionRegistry()
+atexit.register(_registry.stop_all)  # once per process; runs after close_pools
+
+
+def get_registry() -> SessionRegistry:
+    return _registry
@@ -0,0 +1,218 @@
+# Non-blocking avatar speech.
+#
+# Each HeyGen session gets one background worker with an ordered queue, so
+# the Streamlit script thread only enqueues text and its rerun returns
+# immediately. Utterances that pile up while the avatar is busy are coalesced
+# into a single streaming.task call. Workers exit after sitting idle and are
+# recreated on the next enqueue. speak() returns a Future that resolves to the
+# time the task carrying the text was accepted, so callers can time the
+# avatar's first speech rather than the hand-off.
+#
+# Environment:
+#   HEYGEN_TASK_MODE          "sync" (worker waits for each task) or "async"
+#   SPEECH_COALESCE_MAX_CHARS longest text merged into one task   (default 600)
+#   SPEECH_WORKER_IDLE_SECS   idle time before a worker exits     (default 300)
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+from applog import debug
+from heygen import interrupt_session, send_text_to_avatar
+from metrics import Histogram
+from tracing import observe, run_in_context
+
+HEYGEN_TASK_MODE = os.getenv("HEYGEN_TASK_MODE", "sync")
+SPEECH_COALESCE_MAX_CHARS = int(os.getenv("SPEECH_COALESCE_MAX_CHARS", "600"))
+SPEECH_WORKER_IDLE_SECS = float(os.getenv("SPEECH_WORKER_IDLE_SECS", "300"))
+
+
+class WorkerClosed(RuntimeError):
+    """enqueue() on a worker that has already exited."""
+
+
+class SpeechWorker:
+    def __init__(self, session_id: str, session_token: str, task_mode: str = HEYGEN_TASK_MODE):
+        self.session_id = session_id
+        self.session_token = session_token
+        self.task_mode = task_mode
+        self._pending: deque = deque()  # (enqueued_at, text, future)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._busy = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_latency: Optional[float] = None
+        self.latency = Histogram()   # enqueue -> task accepted
+        self.service = Histogram()   # streaming.task call time
+        self._thread = threading.Thread(target=run_in_context(self._run), name=f"speech-{session_id[:8]}", daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive() and not self._closed
+
+    def enqueue(self, text: str) -> Future:
+        """Queue text for the avatar.
+
+        The Future resolves to the monotonic time its streaming.task was
+        accepted; it fails with the task's error and is cancelled if the text
+        is flushed (or empty). Raises WorkerClosed if the worker has exited
+        (e.g. it just went idle).
+        """
+        text = (text or "").strip()
+        fut: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise WorkerClosed(self.session_id)
+            if text:
+                self._pending.append((time.monotonic(), text, fut))
+                self._cond.notify()
+        if not text:
+            fut.cancel()
+        return fut
+
+    def _take(self) -> Optional[tuple]:
+        # Caller holds the lock. Merge back-to-back utterances up to the limit.
+        first_at, text, fut = self._pending.popleft()
+        futures = [fut]
+        while self._pending and len(text) + 1 + len(self._pending[0][1]) <= SPEECH_COALESCE_MAX_CHARS:
+            _at, more, fut = self._pending.popleft()
+            text = f"{text} {more}"
+            futures.append(fut)
+        self.coalesced += len(futures) - 1
+        return first_at, text, futures
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + SPEECH_WORKER_IDLE_SECS
+                while not self._pending and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._closed = True
+                        break
+                    self._cond.wait(timeout=remaining)
+                if self._closed:
+                    return
+                enqueued_at, text, futures = self._take()
+                self._busy = True
+            t0 = time.monotonic()
+            try:
+                send_text_to_avatar(self.session_id, self.session_token, text, task_mode=self.task_mode)
+                self.sent += 1
+                accepted = time.monotonic()
+                for fut in futures:
+                    fut.set_result(accepted)
+            except Exception as e:
+                self.errors += 1
+                debug(f"[speech] task failed: {repr(e)}")
+                for fut in futures:
+                    fut.set_exception(e)
+            finally:
+                done = time.monotonic()
+                self.service.observe(done - t0)
+                self.latency.observe(done - enqueued_at)
+                observe("speech_queue", done - enqueued_at)
+                self.last_latency = done - enqueued_at
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self) -> int:
+        """Drop everything not yet sent; returns how many utterances were dropped."""
+        with self._cond:
+            dropped = list(self._pending)
+            self._pending.clear()
+            n = len(dropped)
+            self.dropped += n
+        for _at, _text, fut in dropped:
+            fut.cancel()
+        if n:
+            debug(f"[speech] flushed {n} queued utterances")
+        return n
+
+    def interrupt(self):
+        """Flush the queue and stop whatever the avatar is saying now."""
+        self.flush()
+        threading.Thread(target=self._interrupt, daemon=True).start()
+
+    def _interrupt(self):
+        try:
+            interrupt_session(self.session_id, self.session_token)
+        except Exception as e:
+            debug(f"[speech] interrupt failed: {repr(e)}")
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            dropped = list(self._pending)
+            self._pending.clear()
+            self._cond.notify_all()
+        for _at, _text, fut in dropped:
+            fut.cancel()
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth, busy = len(self._pending), self._busy
+        return {
+            "depth": depth,
+            "busy": busy,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_latency": self.last_latency,
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p95": self.latency.quantile(0.95),
+        }
+
+
+_workers: dict = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(session_id: str, session_token: str) -> SpeechWorker:
+    with _workers_lock:
+        w = _workers.get(session_id)
+        if w is None or not w.alive or w.session_token != session_token:
+            if w is not None:
+                w.close()
+            w = _workers[session_id] = SpeechWorker(session_id, session_token)
+        return w
+
+
+def speak(session_id: str, session_token: str, text: str) -> Future:
+    """Enqueue text on the session's worker; see SpeechWorker.enqueue."""
+    try:
+        return get_worker(session_id, session_token).enqueue(text)
+    except WorkerClosed:
+        # Went idle between get_worker() and enqueue(); the next one is fresh.
+        return get_worker(session_id, session_token).enqueue(text)
+
+
+def peek_worker(session_id: Optional[str]) -> Optional[SpeechWorker]:
+    with _workers_lock:
+        return _workers.get(session_id) if session_id else None
+
+
+def close_worker(session_id: Optional[str]):
+    with _workers_lock:
+        w = _workers.pop(session_id, None) if session_id else None
+    if w is not None:
+        w.close()
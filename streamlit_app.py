@@ -9,18 +9,34 @@
 #   * ChatGPT (orange)
 # - No functional changes to any feature
 
-import atexit
-import json
 import os
 import time
-import subprocess
+import uuid
 from pathlib import Path
 from typing import Optional
 
-import requests
 import streamlit as st
 import streamlit.components.v1 as components
 
+import asr
+import asr_tune
+import capabilities
+import heygen
+from applog import debug
+from asr import transcribe
+from audio import decode_audio, pcm_to_wav_bytes, prepare_for_soundbar, sniff_mime
+from heygen import stop_session
+from live_asr import LIVE_ASR, LIVE_ASR_REFRESH, LiveTranscriber, live_available
+from llm import LLM_CACHE, chat_completion, stream_reply, time_first_speech
+from memory import new_conversation
+from ratelimit import RateLimited
+from session_pool import acquire_session, get_pool
+from session_registry import HEYGEN_SLOT_POLL, SessionLimitReached, get_registry
+from speech_queue import close_worker, peek_worker, speak
+from tracing import set_correlation_id, span, start_metrics_server
+from viewer_component import avatar_viewer
+from voice_turn import HANDS_FREE, VoiceTurn
+
 st.set_page_config(page_title="Avatharam-2", layout="centered")
 st.text("by Krish Ambady")
 
@@ -102,25 +118,7 @@ OPENAI_API_KEY = (
 if not HEYGEN_API_KEY:
     st.error("Missing HeyGen API key in .streamlit/secrets.toml")
     st.stop()
-
-# ---------------- Endpoints ----------------
-BASE = "https://api.heygen.com/v1"
-API_STREAM_NEW = f"{BASE}/streaming.new"
-API_CREATE_TOKEN = f"{BASE}/streaming.create_token"
-API_STREAM_TASK = f"{BASE}/streaming.task"
-API_STREAM_STOP = f"{BASE}/streaming.stop"
-
-HEADERS_XAPI = {
-    "accept": "application/json",
-    "x-api-key": HEYGEN_API_KEY,
-    "Content-Type": "application/json",
-}
-def _headers_bearer(tok: str):
-    return {
-        "accept": "application/json",
-        "Authorization": f"Bearer {tok}",
-        "Content-Type": "application/json",
-    }
+heygen.configure(HEYGEN_API_KEY)
 
 # ---------------- Session State ----------------
 ss = st.session_state
@@ -134,196 +132,78 @@ ss.setdefault("voice_ready", False)
 ss.setdefault("voice_inserted_once", False)
 ss.setdefault("bgm_should_play", True)
 ss.setdefault("auto_started", False)
-
-# ---------------- Debug ----------------
-def debug(msg: str):
-    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
-
-# ---------------- HTTP helpers ----------------
-def _post_xapi(url, payload=None):
-    r = requests.post(url, headers=HEADERS_XAPI, data=json.dumps(payload or {}), timeout=60)
-    try:
-        body = r.json()
-    except Exception:
-        body = {"_raw": r.text}
-    debug(f"[POST x-api] {url} -> {r.status_code}")
-    if r.status_code >= 400:
-        debug(r.text)
-        r.raise_for_status()
-    return r.status_code, body
-
-def _post_bearer(url, token, payload=None):
-    r = requests.post(url, headers=_headers_bearer(token), data=json.dumps(payload or {}), timeout=60)
-    try:
-        body = r.json()
-    except Exception:
-        body = {"_raw": r.text}
-    debug(f"[POST bearer] {url} -> {r.status_code}")
-    if r.status_code >= 400:
-        debug(r.text)
-        r.raise_for_status()
-    return r.status_code, body
-
-# ---------------- HeyGen helpers ----------------
-def new_session(avatar_id: str, voice_id: Optional[str] = None):
-    payload = {"avatar_id": avatar_id}
-    if voice_id:
-        payload["voice_id"] = voice_id
-    _, body = _post_xapi(API_STREAM_NEW, payload)
-    data = body.get("data") or {}
-    sid = data.get("session_id")
-    offer_sdp = (data.get("offer") or data.get("sdp") or {}).get("sdp")
-    ice2 = data.get("ice_servers2")
-    ice1 = data.get("ice_servers")
-    if isinstance(ice2, list) and ice2:
-        rtc_config = {"iceServers": ice2}
-    elif isinstance(ice1, list) and ice1:
-        rtc_config = {"iceServers": ice1}
+ss.setdefault("stream_replies", os.getenv("CHATGPT_STREAM", "1") == "1")
+ss.setdefault("last_turn_timing", None)
+ss.setdefault("use_llm_cache", LLM_CACHE)
+ss.setdefault("trace_id", uuid.uuid4().hex[:8])
+ss.setdefault("live_asr", LIVE_ASR)
+ss.setdefault("hands_free", HANDS_FREE)
+ss.setdefault("voice_turn", None)
+ss.setdefault("viewer_stats", None)
+ss.setdefault("conversation", new_conversation())
+ss.setdefault("last_reply", None)
+ss.setdefault("turn_error", None)
+ss.setdefault("waiting_for_slot", False)
+
+# ---------------- Tracing ----------------
+set_correlation_id(ss.trace_id)
+start_metrics_server()
+
+# ---------------- Session liveness ----------------
+# Every rerun is activity; a session the idle reaper stopped is dropped here.
+if ss.session_id:
+    if get_registry().alive(ss.session_id):
+        get_registry().touch(ss.session_id)
     else:
-        rtc_config = {"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}
-    if not sid or not offer_sdp:
-        raise RuntimeError(f"Missing session_id or offer in response: {body}")
-    return {"session_id": sid, "offer_sdp": offer_sdp, "rtc_config": rtc_config}
-
-def create_session_token(session_id: str) -> str:
-    _, body = _post_xapi(API_CREATE_TOKEN, {"session_id": session_id})
-    tok = (body.get("data") or {}).get("token") or (body.get("data") or {}).get("access_token")
-    if not tok:
-        raise RuntimeError(f"Missing token in response: {body}")
-    return tok
-
-def send_text_to_avatar(session_id: str, session_token: str, text: str):
-    debug(f"[avatar] speak {len(text)} chars")
-    _post_bearer(
-        API_STREAM_TASK,
-        session_token,
-        {
-            "session_id": session_id,
-            "task_type": "repeat",
-            "task_mode": "sync",
-            "text": text,
-        },
-    )
+        debug(f"[registry] session {ss.session_id[:8]}... is gone; clearing")
+        close_worker(ss.session_id)
+        ss.session_id = ss.session_token = ss.offer_sdp = ss.rtc_config = None
+
+# ---------------- Capabilities (probed and preloaded once per process) ----------------
+capabilities.start()
+
+# ---------------- Local ASR models (loaded once per process) ----------------
+if os.getenv("ASR_WARMUP") == "1":
+    asr.warm_up()
+asr_tune.start()  # ASR_TUNE=1 and nothing calibrated for this host yet
+
+# ---------------- Pre-warmed sessions (HEYGEN_POOL_SIZE > 0) ----------------
+get_pool(FIXED_AVATAR["avatar_id"], FIXED_AVATAR.get("default_voice"))
+
+# Shutdown: session_pool and session_registry register atexit hooks once per
+# process that stop pooled and then every other live session.
+
+# ---------------- Hands-free turns ----------------
+def _start_turn(transcript: str):
+    _cancel_turn("superseded")
+    if ss.hands_free and transcript and OPENAI_API_KEY:
+        ss.voice_turn = VoiceTurn(OPENAI_API_KEY, transcript, ss.session_id, ss.session_token,
+                                  use_cache=ss.use_llm_cache, history=_history())
+
+def _history():
+    return ss.conversation.history() if ss.conversation is not None else None
+
+def _remember_turn(user_text: str, reply: str):
+    # The reply is shown above the edit box, which is cleared for the next message.
+    ss.last_reply = reply
+    ss.gpt_query = ""
+    ss.pop("txt_edit_gpt_query", None)  # otherwise the widget keeps the typed text
+    if ss.conversation is not None:
+        ss.conversation.add(user_text, reply)
+        ss.conversation.fold(OPENAI_API_KEY)
+
+def _llm_failed(e: BaseException):
+    # Queued out by the rate limiter, or still 429 after retries: ask for a retry.
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(e, RateLimited) or status == 429:
+        st.warning("ChatGPT is busy right now, please try again in a moment.")
+    else:
+        st.error("ChatGPT call failed. See Streamlit logs.")
 
-def stop_session(session_id: Optional[str], session_token: Optional[str]):
-    if not (session_id and session_token):
-        return
-    try:
-        _post_bearer(API_STREAM_STOP, session_token, {"session_id": session_id})
-        debug("[stop] session stopped")
-    except Exception as e:
-        debug(f"[stop_session] {e}")
-
-@atexit.register
-def _graceful_shutdown():
-    try:
-        sid = st.session_state.get("session_id")
-        tok = st.session_state.get("session_token")
-        if sid and tok:
-            stop_session(sid, tok)
-    except Exception:
-        pass
-
-# ---------------- Audio helpers ----------------
-def sniff_mime(b: bytes) -> str:
-    try:
-        if len(b) >= 12 and b[:4] == b"RIFF" and b[8:12] == b"WAVE":
-            return "audio/wav"
-        if b.startswith(b"ID3") or (len(b) > 1 and b[0] == 0xFF and (b[1] & 0xE0) == 0xE0):
-            return "audio/mpeg"
-        if b.startswith(b"OggS"):
-            return "audio/ogg"
-        if len(b) >= 4 and b[:4] == b"\x1a\x45\xdf\xa3":
-            return "audio/webm"
-        if len(b) >= 12 and b[4:8] == b"ftyp":
-            return "audio/mp4"
-    except Exception:
-        pass
-    return "audio/wav"
-
-def _ffmpeg_convert_bytes(inp: bytes, in_ext: str, out_ext: str, ff_args: list) -> tuple[Optional[bytes], bool]:
-    try:
-        _ = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    except Exception:
-        debug("[ffmpeg] not found on PATH")
-        return None, False
-    try:
-        import tempfile
-        with tempfile.TemporaryDirectory() as td:
-            in_path = Path(td) / f"in{in_ext}"
-            out_path = Path(td) / f"out{out_ext}"
-            in_path.write_bytes(inp)
-            cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", str(in_path)] + ff_args + [str(out_path)]
-            subprocess.run(cmd, check=True)
-            out = out_path.read_bytes()
-            debug(f"[ffmpeg] converted {in_ext}->{out_ext}, bytes={len(out)}")
-            return out, True
-    except Exception as e:
-        debug(f"[ffmpeg] conversion failed: {repr(e)}")
-        return None, False
-
-def prepare_for_soundbar(audio_bytes: bytes, mime: str) -> tuple[bytes, str]:
-    if mime in ("audio/webm", "audio/ogg"):
-        out, ok = _ffmpeg_convert_bytes(audio_bytes, ".webm" if mime.endswith("webm") else ".ogg", ".wav", ["-ar", "16000", "-ac", "1"])
-        debug(f"[soundbar] convert={ok}, final_mime={'audio/wav' if ok else mime}")
-        if ok and out:
-            return out, "audio/wav"
-        return audio_bytes, mime
-    if mime == "audio/mp4":
-        debug("[soundbar] pass mp4")
-        return audio_bytes, "audio/mp4"
-    debug(f"[soundbar] pass-through mime={mime}")
-    return audio_bytes, mime
-
-# ---------------- Local ASR helper ----------------
-def _save_bytes_tmp(b: bytes, suffix: str) -> str:
-    tmp = Path("/tmp") if Path("/tmp").exists() else Path.cwd()
-    f = tmp / f"audio_{int(time.time()*1000)}{suffix}"
-    f.write_bytes(b)
-    return str(f)
-
-def transcribe_local(audio_bytes: bytes, mime: str) -> str:
-    ext = ".wav" if "wav" in mime else ".mp3" if "mp3" in mime else ".webm" if "webm" in mime else ".ogg" if "ogg" in mime else ".m4a"
-    fpath = _save_bytes_tmp(audio_bytes, ext)
-    try:
-        from faster_whisper import WhisperModel
-        model = WhisperModel("tiny", device="auto", compute_type="int8")
-        segments, _info = model.transcribe(fpath, beam_size=1, language="en")
-        txt = " ".join(s.text.strip() for s in segments).strip()
-        if txt:
-            return txt
-    except Exception as e:
-        debug(f"[local asr] faster-whisper error: {repr(e)}")
-    try:
-        import json as _json
-        from vosk import Model, KaldiRecognizer
-        model_path = os.getenv("VOSK_MODEL_PATH")
-        if model_path and Path(model_path).exists():
-            outwav = fpath if fpath.endswith(".wav") else fpath + ".wav"
-            try:
-                subprocess.run(["ffmpeg", "-y", "-i", fpath, "-ar", "16000", "-ac", "1", outwav], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            except Exception:
-                outwav = fpath
-            import wave
-            wf = wave.open(outwav, "rb")
-            rec = KaldiRecognizer(Model(model_path), wf.getframerate())
-            rec.SetWords(True)
-            result = []
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if rec.AcceptWaveform(data):
-                    j = _json.loads(rec.Result())
-                    result.append(j.get("text", ""))
-            j = _json.loads(rec.FinalResult())
-            result.append(j.get("text", ""))
-            txt = " ".join(x.strip() for x in result if x).strip()
-            if txt:
-                return txt
-    except Exception as e:
-        debug(f"[local asr] vosk error: {repr(e)}")
-    return ""
+def _cancel_turn(reason: str):
+    if ss.voice_turn is not None:
+        ss.voice_turn.cancel(reason)
+        ss.voice_turn = None
 
 # ---------------- Header ----------------
 cols = st.columns([1, 12, 1])
@@ -338,20 +218,28 @@ if ss.show_sidebar:
         st.markdown("### Controls")
         if st.button("Start", key="btn_start_sidebar"):
             if ss.session_id and ss.session_token:
+                close_worker(ss.session_id)
                 stop_session(ss.session_id, ss.session_token)
                 time.sleep(0.2)
-            debug("Step 1: streaming.new")
-            created = new_session(FIXED_AVATAR["avatar_id"], FIXED_AVATAR.get("default_voice"))
-            sid, offer_sdp, rtc_config = created["session_id"], created["offer_sdp"], created["rtc_config"]
-            debug("Step 2: streaming.create_token")
-            tok = create_session_token(sid)
-            debug("Step 3: sleep 1.0s before viewer")
-            time.sleep(1.0)
-            ss.session_id, ss.session_token = sid, tok
-            ss.offer_sdp, ss.rtc_config = offer_sdp, rtc_config
-            ss.bgm_should_play = True
-            debug(f"[ready] session_id={sid[:8]}...")
+            debug("Step 1: acquire session (pool or streaming.new + create_token)")
+            ss.session_id = ss.session_token = ss.offer_sdp = ss.rtc_config = None
+            try:
+                with span("session_start"):
+                    created = acquire_session(FIXED_AVATAR["avatar_id"], FIXED_AVATAR.get("default_voice"))
+            except SessionLimitReached:
+                st.warning("All avatars are busy right now. Please try Start again in a moment.")
+            else:
+                sid, tok = created["session_id"], created["session_token"]
+                offer_sdp, rtc_config = created["offer_sdp"], created["rtc_config"]
+                ss.session_id, ss.session_token = sid, tok
+                ss.offer_sdp, ss.rtc_config = offer_sdp, rtc_config
+                ss.bgm_should_play = True
+                ss.auto_started = True  # stops the slot poll, which would start a second session
+                ss.waiting_for_slot = False
+                debug(f"[ready] session_id={sid[:8]}...")
         if st.button("Stop", key="btn_stop_sidebar"):
+            _cancel_turn("session stopped")
+            close_worker(ss.session_id)
             stop_session(ss.session_id, ss.session_token)
             ss.session_id = None
             ss.session_token = None
@@ -359,6 +247,40 @@ if ss.show_sidebar:
             ss.rtc_config = None
             ss.bgm_should_play = False
             debug("[stopped] session cleared")
+        worker = peek_worker(ss.session_id)
+        if st.button("Interrupt", key="btn_interrupt_sidebar", help="Stop speaking and drop queued speech"):
+            if worker is not None:
+                worker.interrupt()
+        if worker is not None:
+            q = worker.stats()
+            last = q["last_latency"]
+            st.caption(f"Speech queue: {q['depth']} waiting, {q['sent']} sent, last task {'-' if last is None else f'{last:.2f}s'}")
+        ss.stream_replies = st.checkbox("Stream ChatGPT replies", value=ss.stream_replies, key="chk_stream_replies")
+        ss.use_llm_cache = st.checkbox("Reuse cached ChatGPT replies", value=ss.use_llm_cache, key="chk_llm_cache")
+        if live_available():
+            ss.live_asr = st.checkbox("Live transcription", value=ss.live_asr, key="chk_live_asr",
+                                      help="Transcribe while you speak instead of after you stop")
+        ss.hands_free = st.checkbox("Hands-free replies", value=ss.hands_free, key="chk_hands_free",
+                                    help="Send each voice transcript to ChatGPT and the avatar without clicking")
+        v = ss.viewer_stats
+        if v and v.get("session_id") == ss.session_id:
+            fmt = lambda x, unit="ms": "-" if x is None else f"{x}{unit}"
+            st.caption(f"Stream: first frame {fmt(v.get('ttff_ms'))}, RTT {fmt(v.get('rtt_ms'))}, "
+                       f"jitter {fmt(v.get('video_jitter_ms'))}, {v.get('frames_decoded') or 0} frames, "
+                       f"{v.get('reconnects', 0)} reconnects")
+        if ss.conversation is not None:
+            m = ss.conversation.stats()
+            st.caption(f"Memory: {m['in_prompt']} of {m['turns']} turns in the prompt, ~{m['prompt_tokens']} tokens "
+                       f"(summary {m['summary_tokens']})")
+            if m["turns"] and st.button("Forget conversation", key="btn_forget"):
+                ss.conversation.clear()
+                ss.last_reply = None
+        if ss.last_turn_timing:
+            t = ss.last_turn_timing
+            # first_speech arrives from the speech worker, possibly after the rerun that stored the timing.
+            first, queued = t.get("first_speech"), t.get("first_sentence")
+            st.caption(f"Last turn: first speech {'-' if first is None else f'{first:.2f}s'} "
+                       f"(queued {'-' if queued is None else f'{queued:.2f}s'}), total {t['total']:.2f}s")
 
 # ---------------- Background music ----------------
 benhur_path = Path(__file__).parent / "BenHur-Music.mp3"
@@ -368,22 +290,43 @@ else:
     components.html("<div id='bgm_off'></div>", height=0, scrolling=False)
 
 # ---------------- Auto-start the avatar session ----------------
-if not ss.auto_started:
+def _auto_start() -> bool:
+    # Never waits for a slot, so the controls below are drawn straight away.
+    if ss.session_id:
+        ss.auto_started, ss.waiting_for_slot = True, False
+        return True
     try:
         debug("[auto-start] initializing session")
-        created = new_session(FIXED_AVATAR["avatar_id"], FIXED_AVATAR.get("default_voice"))
-        sid, offer_sdp, rtc_config = created["session_id"], created["offer_sdp"], created["rtc_config"]
-        tok = create_session_token(sid)
-        time.sleep(0.8)
-        ss.session_id, ss.session_token = sid, tok
-        ss.offer_sdp, ss.rtc_config = offer_sdp, rtc_config
-        ss.auto_started = True
-        debug(f"[auto-start] session ready id={sid[:8]}...")
+        with span("auto_start"):
+            created = acquire_session(FIXED_AVATAR["avatar_id"], FIXED_AVATAR.get("default_voice"), slot_wait=0)
+    except SessionLimitReached as e:
+        ss.waiting_for_slot = True
+        debug(f"[auto-start] no slot: {e}")
+        return False
     except Exception as e:
         debug(f"[auto-start] failed: {repr(e)}")
+        return False
+    sid, tok = created["session_id"], created["session_token"]
+    offer_sdp, rtc_config = created["offer_sdp"], created["rtc_config"]
+    ss.session_id, ss.session_token = sid, tok
+    ss.offer_sdp, ss.rtc_config = offer_sdp, rtc_config
+    ss.auto_started = True
+    ss.waiting_for_slot = False
+    debug(f"[auto-start] session ready id={sid[:8]}...")
+    return True
+
+def _wait_for_slot():
+    # Reruns on its own every HEYGEN_SLOT_POLL seconds until a slot is free.
+    if _auto_start():
+        st.rerun()  # full rerun draws the viewer
+    st.info("All avatars are busy right now; you will be connected as soon as one is free.")
+
+if not ss.auto_started and not ss.waiting_for_slot:
+    _auto_start()
+if not ss.auto_started and ss.waiting_for_slot:
+    st.fragment(run_every=HEYGEN_SLOT_POLL)(_wait_for_slot)()
 
 # ---------------- Main viewer area ----------------
-viewer_path = Path(__file__).parent / "viewer.html"
 viewer_loaded = ss.session_id and ss.session_token and ss.offer_sdp
 
 if viewer_loaded and ss.bgm_should_play:
@@ -399,30 +342,37 @@ def _image_compat(url: str, caption: str = ""):
         except TypeError:
             st.image(url, caption=caption)
 
-if viewer_loaded and viewer_path.exists():
-    html = (
-        viewer_path.read_text(encoding="utf-8")
-        .replace("__SESSION_TOKEN__", ss.session_token)
-        .replace("__AVATAR_NAME__", FIXED_AVATAR["pose_name"])
-        .replace("__SESSION_ID__", ss.session_id)
-        .replace("__OFFER_SDP__", json.dumps(ss.offer_sdp)[1:-1])
-        .replace("__RTC_CONFIG__", json.dumps(ss.rtc_config or {}))
-    )
-    components.html(html, height=340, scrolling=False)
+@st.fragment
+def _viewer():
+    # A stats report reruns only this fragment, so the rest of the page (the
+    # recording's playback, warnings, errors) stays as it was drawn.
+    stats = avatar_viewer(ss.session_id, ss.session_token, ss.offer_sdp, ss.rtc_config,
+                          FIXED_AVATAR["pose_name"], height=340)
+    if stats is not None:
+        ss.viewer_stats = stats
+        get_registry().touch(ss.session_id)  # an open viewer is activity
+
+if viewer_loaded:
+    # Stable key: the same iframe and peer connection across reruns.
+    _viewer()
 else:
     if ss.session_id is None and ss.session_token is None:
         _image_compat(FIXED_AVATAR["normal_preview"], caption=f"{FIXED_AVATAR['pose_name']} ({FIXED_AVATAR['avatar_id']})")
 
 # ---------------- Mic recorder (centered; colored via #microw CSS) ----------------
-try:
-    from streamlit_mic_recorder import mic_recorder
-    _HAS_MIC = True
-except Exception:
-    mic_recorder = None
-    _HAS_MIC = False
+mic_recorder = None
+_HAS_MIC = False
+if capabilities.has("mic_recorder"):
+    try:
+        from streamlit_mic_recorder import mic_recorder
+        _HAS_MIC = True
+    except Exception as e:
+        debug(f"[mic] recorder unavailable: {repr(e)}")
 
 wav_bytes: Optional[bytes] = None
 mime: str = "audio/wav"
+live_mode = ss.live_asr and live_available()
+live_playing = False
 
 with st.container():
     center_cols = st.columns([1, 2, 1])  # keep centered
@@ -430,15 +380,40 @@ with st.container():
         # The recorder renders its own two buttons; we wrap this area so the CSS can
         # target the immediate horizontal block inside.
         st.markdown('<div id="microw">', unsafe_allow_html=True)
-        audio = mic_recorder(
-            start_prompt="Speak",
-            stop_prompt="Stop",
-            just_once=True,
-            use_container_width=True,
-            key="mic_recorder_main",
-        ) if _HAS_MIC else None
+        if live_mode:
+            # Frames go to Vosk as they arrive; nothing is sent back to the browser.
+            from streamlit_webrtc import WebRtcMode, webrtc_streamer
+            if "live_transcriber" not in ss:
+                ss.live_transcriber = LiveTranscriber()
+            webrtc_ctx = webrtc_streamer(
+                key="live_mic",
+                mode=WebRtcMode.SENDRECV,
+                audio_frame_callback=ss.live_transcriber.on_frame,
+                media_stream_constraints={"audio": True, "video": False},
+                sendback_audio=False,
+                translations={"start": "Speak", "stop": "Stop"},
+            )
+            live_playing = bool(webrtc_ctx.state.playing)
+            if live_playing:
+                _cancel_turn("new recording")
+            audio = None
+        else:
+            audio = mic_recorder(
+                start_prompt="Speak",
+                stop_prompt="Stop",
+                just_once=True,
+                use_container_width=True,
+                key="mic_recorder_main",
+            ) if _HAS_MIC else None
         st.markdown("</div>", unsafe_allow_html=True)
 
+if live_mode and not live_playing and ss.live_transcriber.has_audio:
+    transcript_text, live_pcm = ss.live_transcriber.finish()
+    ss.gpt_query = transcript_text or "(no speech recognized)"
+    _start_turn(transcript_text)
+    if live_pcm.size:
+        st.audio(pcm_to_wav_bytes(live_pcm), format="audio/wav", autoplay=False)
+
 if _HAS_MIC:
     if isinstance(audio, dict) and audio.get("bytes"):
         wav_bytes = audio["bytes"]
@@ -446,6 +421,7 @@ if _HAS_MIC:
         ss.gpt_query = ""
         ss.voice_inserted_once = False
         ss.voice_ready = True
+        _cancel_turn("new recording")
         debug(f"[mic] received {len(wav_bytes)} bytes, mime={mime}")
     elif isinstance(audio, (bytes, bytearray)) and audio:
         wav_bytes = bytes(audio)
@@ -453,21 +429,29 @@ if _HAS_MIC:
         ss.gpt_query = ""
         ss.voice_inserted_once = False
         ss.voice_ready = True
+        _cancel_turn("new recording")
         debug(f"[mic] received {len(wav_bytes)} bytes (raw), mime={mime}")
 
 if ss.voice_ready and wav_bytes:
+    # Decode once; ASR and the soundbar both read this 16 kHz mono buffer.
+    pcm = decode_audio(wav_bytes, mime)
     if not ss.voice_inserted_once:
         transcript_text = ""
         try:
-            transcript_text = transcribe_local(wav_bytes, mime)
+            result = transcribe(wav_bytes, mime, pcm=pcm)
+            transcript_text = result.text
+            debug(f"[voice->text] {result!r}")
+            if result.status in ("busy", "timeout"):
+                st.warning("The speech recognizer is busy right now. Please press Speak and try again.")
         except Exception as e:
             debug(f"[voice->text error] {repr(e)}")
+        _start_turn(transcript_text)
         if not transcript_text:
             transcript_text = "(no speech recognized)"
         ss.gpt_query = transcript_text
         ss.voice_inserted_once = True
         debug(f"[voice->editbox] {len(transcript_text)} chars")
-    bar_bytes, bar_mime = prepare_for_soundbar(wav_bytes, mime)
+    bar_bytes, bar_mime = prepare_for_soundbar(wav_bytes, mime, pcm=pcm)
     st.audio(bar_bytes, format=bar_mime, autoplay=False)
 
 if ss.voice_ready and ss.voice_inserted_once:
@@ -481,52 +465,89 @@ with col1:
         if not (ss.session_id and ss.session_token and ss.offer_sdp):
             st.warning("Start a session first.")
         else:
-            send_text_to_avatar(
+            speak(
                 ss.session_id,
                 ss.session_token,
                 "To speak to me, press the speak button, pause a second and then speak. Once you have spoken press the [Stop] button",
             )
 with col2:
     if st.button("ChatGPT", key="btn_chatgpt_main", use_container_width=True):
+        _cancel_turn("manual ChatGPT")
         user_text = (ss.get("gpt_query") or "").strip()
         if not user_text:
             debug("[chatgpt] empty user text; skipping]")
         else:
             debug(f"[user->gpt] {len(user_text)} chars")
-            url = "https://api.openai.com/v1/chat/completions"
-            headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-            payload = {
-                "model": "gpt-4o-mini",
-                "messages": [
-                    {"role": "system", "content": "You are a clear, concise assistant."},
-                    {"role": "user", "content": user_text},
-                ],
-                "temperature": 0.6,
-                "max_tokens": 600,
-            }
+            has_avatar = bool(ss.session_id and ss.session_token)
             try:
-                r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
-                debug(f"[openai] status {r.status_code}")
-                body = r.json()
-                reply = (body.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
-                if reply:
-                    prev = (ss.get("gpt_query") or "").rstrip()
-                    joiner = "\n\n" if prev else ""
-                    ss.gpt_query = f"{prev}{joiner}Assistant: {reply}"
-                    if ss.session_id and ss.session_token:
-                        send_text_to_avatar(ss.session_id, ss.session_token, reply)
+                if ss.stream_replies:
+                    on_sentence = None
+                    if has_avatar:
+                        sid, tok = ss.session_id, ss.session_token
+                        on_sentence = lambda chunk: speak(sid, tok, chunk)
+                    reply, ss.last_turn_timing = stream_reply(
+                        OPENAI_API_KEY, user_text, speak=on_sentence, use_cache=ss.use_llm_cache,
+                        history=_history(),
+                    )
                 else:
-                    debug(f"[openai] empty reply: {body}")
+                    t0 = time.monotonic()
+                    reply = chat_completion(OPENAI_API_KEY, user_text, use_cache=ss.use_llm_cache,
+                                            history=_history())
+                    if reply and has_avatar:
+                        t_speak = time.monotonic() - t0
+                        spoken = speak(ss.session_id, ss.session_token, reply)
+                        ss.last_turn_timing = {"first_sentence": t_speak, "first_speech": None,
+                                               "total": time.monotonic() - t0}
+                        time_first_speech(spoken, ss.last_turn_timing, t0)
+                if reply:
+                    _remember_turn(user_text, reply)
             except Exception as e:
-                st.error("ChatGPT call failed. See Streamlit logs.")
+                _llm_failed(e)
                 debug(f"[openai error] {repr(e)}")
 st.markdown("</div>", unsafe_allow_html=True)
 
 # ---------------- Edit box ----------------
-ss.gpt_query = st.text_area(
-    "Edit message",
-    value=ss.get("gpt_query", "Hello, welcome."),
-    height=140,
-    label_visibility="collapsed",
-    key="txt_edit_gpt_query",
-)
+def _apply_turn(refreshing: bool = False):
+    # Record a finished hands-free reply; True when one was applied.
+    turn = ss.voice_turn
+    if turn is None or not turn.finished:
+        return False
+    ss.voice_turn = None
+    if turn.reply:
+        _remember_turn(turn.transcript, turn.reply)
+        ss.last_turn_timing = turn.timings
+    elif turn.error is not None:
+        if refreshing:
+            ss.turn_error = turn.error  # the fragment's full rerun would wipe it; shown after
+        else:
+            _llm_failed(turn.error)
+    return True
+
+def _edit_box(refreshing: bool = False):
+    if live_playing:
+        ss.gpt_query = ss.live_transcriber.text()
+    applied = _apply_turn(refreshing)
+    ss.gpt_query = st.text_area(
+        "Edit message",
+        value=ss.get("gpt_query", "Hello, welcome."),
+        height=140,
+        label_visibility="collapsed",
+        key="txt_edit_gpt_query",
+    )
+    if ss.voice_turn is not None and ss.gpt_query.strip() != ss.voice_turn.transcript:
+        _cancel_turn("transcript edited")
+    if refreshing and applied:
+        st.rerun()  # full rerun ends the refresh loop
+
+if ss.turn_error is not None:
+    _llm_failed(ss.turn_error)
+    ss.turn_error = None
+if ss.last_reply:
+    st.markdown(f"**Assistant:** {ss.last_reply}")
+
+if live_playing or ss.voice_turn is not None:
+    # Only the edit box reruns while the user speaks or a hands-free reply
+    # streams, showing the partial transcript and then the reply.
+    st.fragment(run_every=LIVE_ASR_REFRESH)(_edit_box)(refreshing=True)
+else:
+    _edit_box()
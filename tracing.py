@@ -0,0 +1,152 @@
+# Timing spans for the voice-turn stages.
+#
+#   with span("asr", engine="whisper"):
+#       ...
+#
+# Each span observes avatharam_stage_seconds{stage=...} (and bumps
+# avatharam_stage_errors_total on exceptions) in metrics.REGISTRY, tagged in
+# the JSONL sink with the visitor's correlation id. A span costs two
+# perf_counter() calls and a bucket increment, so it stays on in production.
+#
+# Environment:
+#   METRICS_PORT   serve REGISTRY as Prometheus text on this port (off if unset)
+#   TRACE_JSONL    append one JSON line per finished span to this file
+
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from applog import correlation_id, debug
+from metrics import REGISTRY
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+TRACE_JSONL = os.getenv("TRACE_JSONL")
+
+_STAGE_HELP = "Wall time of voice-turn stages (auto_start, decode, asr, llm, avatar_task, stop, ...)."
+
+
+def set_correlation_id(cid: Optional[str]):
+    correlation_id.set(cid)
+
+
+def run_in_context(target, *args, **kwargs):
+    """threading.Thread target wrapper that carries the caller's correlation id."""
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(target, *args, **kwargs)
+
+
+# ---------------- JSONL sink ----------------
+class _JsonlSink:
+    # Writes happen on a daemon thread so a slow disk never stalls a request.
+    def __init__(self, path: str):
+        self.path = path
+        self._q: "queue.Queue" = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        threading.Thread(target=self._run, name="trace-jsonl", daemon=True).start()
+
+    def emit(self, record: dict):
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch))
+            except OSError as e:
+                debug(f"[trace] jsonl write failed: {repr(e)}")
+
+
+_sink = _JsonlSink(TRACE_JSONL) if TRACE_JSONL else None
+
+
+# ---------------- Spans ----------------
+@contextmanager
+def span(stage: str, **attrs):
+    """Time a block; extra attrs go to the JSONL record (and can be set inside via the yielded dict)."""
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        REGISTRY.counter("avatharam_stage_errors_total", "Stage failures.", stage=stage).inc()
+        raise
+    finally:
+        secs = time.perf_counter() - t0
+        REGISTRY.histogram("avatharam_stage_seconds", _STAGE_HELP, stage=stage).observe(secs)
+        if _sink is not None:
+            _sink.emit({
+                "ts": round(time.time(), 3),
+                "cid": correlation_id.get(),
+                "stage": stage,
+                "ms": round(secs * 1000, 2),
+                "status": status,
+                **attrs,
+            })
+
+
+def observe(stage: str, secs: float, **attrs):
+    """Record a duration measured elsewhere (e.g. time-to-first-speech)."""
+    REGISTRY.histogram("avatharam_stage_seconds", _STAGE_HELP, stage=stage).observe(secs)
+    if _sink is not None:
+        _sink.emit({"ts": round(time.time(), 3), "cid": correlation_id.get(), "stage": stage,
+                    "ms": round(secs * 1000, 2), "status": "ok", **attrs})
+
+
+def count(name: str, help_text: str = "", **labels):
+    REGISTRY.counter(name, help_text, **labels).inc()
+
+
+# ---------------- Prometheus endpoint ----------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[int]:
+    """Serve /metrics once per process; returns the bound port (None when disabled)."""
+    global _server
+    port = port if port is not None else (int(METRICS_PORT) if METRICS_PORT else None)
+    if port is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                debug(f"[metrics] cannot bind :{port}: {repr(e)}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            debug(f"[metrics] serving Prometheus text on :{_server.server_port}/metrics")
+        return _server.server_port
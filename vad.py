@@ -0,0 +1,94 @@
+# Energy-based voice activity detection on the decoded 16 kHz buffer.
+#
+# Frames are 30 ms; everything is vectorised NumPy (one reshape, one
+# log-energy pass, two convolutions), so a 10 s clip costs well under a
+# millisecond. The threshold adapts to the clip's own noise floor.
+#
+# Environment:
+#   ASR_VAD            "0" disables trimming/splitting/skipping    (default on)
+#   VAD_MARGIN_DB      speech must be this far above the noise floor (default 10)
+#   VAD_MIN_DB         ...and at least this loud, in dBFS            (default -50)
+#   VAD_PAD_MS         audio kept around detected speech             (default 200)
+#   VAD_MIN_PAUSE_MS   shortest pause a long clip is split at        (default 600)
+#   VAD_SPLIT_SECS     only split clips longer than this             (default 10)
+
+import os
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+ASR_VAD = os.getenv("ASR_VAD", "1") != "0"
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+VAD_MIN_DB = float(os.getenv("VAD_MIN_DB", "-50"))
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", "200"))
+VAD_MIN_PAUSE_MS = int(os.getenv("VAD_MIN_PAUSE_MS", "600"))
+VAD_SPLIT_SECS = float(os.getenv("VAD_SPLIT_SECS", "10"))
+
+FRAME_MS = 30
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
+_MIN_SPEECH_FRAMES = 3   # drop clicks shorter than ~90 ms
+_HANGOVER_FRAMES = 4     # bridge gaps shorter than ~120 ms inside words
+
+
+def frame_energy_db(pcm: np.ndarray) -> np.ndarray:
+    n = len(pcm) // FRAME
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = pcm[: n * FRAME].reshape(n, FRAME)
+    return 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+
+def speech_mask(pcm: np.ndarray) -> np.ndarray:
+    """Boolean speech flag per 30 ms frame."""
+    energy = frame_energy_db(pcm)
+    if energy.size == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(energy, 10)
+    mask = energy > max(noise_floor + VAD_MARGIN_DB, VAD_MIN_DB)
+    # Opening removes short blips; closing bridges short gaps.
+    k = np.ones(_MIN_SPEECH_FRAMES)
+    mask = np.convolve(np.convolve(mask, k, "same") >= _MIN_SPEECH_FRAMES, k, "same") > 0
+    h = np.ones(2 * _HANGOVER_FRAMES + 1)
+    return np.convolve(mask, h, "same") > 0
+
+
+def speech_regions(pcm: np.ndarray) -> list:
+    """[(start_sample, end_sample)] of contiguous speech, unpadded."""
+    mask = speech_mask(pcm)
+    if not mask.any():
+        return []
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [(int(s) * FRAME, min(int(e) * FRAME, len(pcm))) for s, e in zip(starts, ends)]
+
+
+def trim(pcm: np.ndarray, regions: list = None) -> np.ndarray:
+    """Cut leading/trailing silence (keeping VAD_PAD_MS); empty array if no speech."""
+    regions = speech_regions(pcm) if regions is None else regions
+    if not regions:
+        return pcm[:0]
+    pad = SAMPLE_RATE * VAD_PAD_MS // 1000
+    return pcm[max(0, regions[0][0] - pad): min(len(pcm), regions[-1][1] + pad)]
+
+
+def split(pcm: np.ndarray, regions: list = None) -> list:
+    """Split a clip at pauses of at least VAD_MIN_PAUSE_MS; short clips stay whole.
+
+    Returns padded segments in order; an empty list means no speech.
+    """
+    regions = speech_regions(pcm) if regions is None else regions
+    if not regions:
+        return []
+    pad = SAMPLE_RATE * VAD_PAD_MS // 1000
+    min_pause = SAMPLE_RATE * VAD_MIN_PAUSE_MS // 1000
+    if (regions[-1][1] - regions[0][0]) / SAMPLE_RATE <= VAD_SPLIT_SECS:
+        return [trim(pcm, regions)]
+    groups = [[regions[0][0], regions[0][1]]]
+    for start, end in regions[1:]:
+        if start - groups[-1][1] < min_pause:
+            groups[-1][1] = end
+        else:
+            groups.append([start, end])
+    return [pcm[max(0, s - pad): min(len(pcm), e + pad)] for s, e in groups]
@@ -0,0 +1,82 @@
+# Avatar viewer as a bidirectional Streamlit component.
+#
+# viewer/index.html is served as a static component, so nothing is
+# templated per rerun and the browser caches it. Session details go in as
+# args; with a stable key the iframe, and its RTCPeerConnection, survive
+# reruns and only reconnect when session_id changes. The page reports
+# getStats() (RTT, jitter, frames decoded), time to first frame and its
+# reconnect count back as the component value.
+#
+# Environment:
+#   VIEWER_STATS_SECS   seconds between stats reports (default 15, 0 = only on
+#                       first frame and reconnects; each report reruns the
+#                       fragment the viewer is drawn in)
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import streamlit.components.v1 as components
+
+import heygen
+from metrics import REGISTRY
+from tracing import observe
+
+VIEWER_STATS_SECS = float(os.getenv("VIEWER_STATS_SECS", "15"))
+
+_component = components.declare_component("avatar_viewer", path=str(Path(__file__).parent / "viewer"))
+
+# The component value repeats on every rerun until the page sends a new
+# report, so each report is recorded once (by its ts). Oldest sessions trimmed.
+_reported: dict = {}  # session id -> {"ts", "first_frame", "reconnects"}
+_reported_lock = threading.Lock()
+_REPORTED_MAX = 1024
+
+
+def avatar_viewer(session_id: str, session_token: str, offer_sdp: str, rtc_config: Optional[dict],
+                  avatar_name: str, height: int = 340, key: str = "avatar_viewer") -> Optional[dict]:
+    """Render the viewer; returns the latest stats report (None until the first one)."""
+    stats = _component(
+        session_id=session_id,
+        session_token=session_token,
+        offer_sdp=offer_sdp,
+        rtc_config=rtc_config or {},
+        avatar_name=avatar_name,
+        start_url=heygen.API_STREAM_START,
+        stats_interval_ms=int(VIEWER_STATS_SECS * 1000),
+        height=height,
+        key=key,
+        default=None,
+    )
+    if isinstance(stats, dict) and stats.get("session_id") == session_id:
+        record_stats(stats)
+        return stats
+    return None
+
+
+def record_stats(stats: dict):
+    """Feed a new viewer report into metrics.REGISTRY."""
+    sid = stats.get("session_id")
+    reconnects = int(stats.get("reconnects") or 0)
+    with _reported_lock:
+        seen = _reported.setdefault(sid, {"ts": 0, "first_frame": False, "reconnects": 0})
+        if (stats.get("ts") or 0) <= seen["ts"]:
+            return
+        seen["ts"] = stats.get("ts") or 0
+        first_frame = stats.get("ttff_ms") is not None and not seen["first_frame"]
+        seen["first_frame"] = seen["first_frame"] or first_frame
+        new = reconnects - seen["reconnects"]
+        seen["reconnects"] = max(seen["reconnects"], reconnects)
+        while len(_reported) > _REPORTED_MAX:
+            _reported.pop(next(iter(_reported)))
+    if first_frame:
+        observe("viewer_first_frame", stats["ttff_ms"] / 1000.0)
+        if stats.get("start_ms") is not None:
+            observe("viewer_streaming_start", stats["start_ms"] / 1000.0)
+    if new > 0:
+        REGISTRY.counter("avatharam_viewer_reconnects_total", "Viewer WebRTC reconnect attempts.").inc(new)
+    for field, name in (("rtt_ms", "rtt"), ("video_jitter_ms", "video_jitter"), ("audio_jitter_ms", "audio_jitter")):
+        if stats.get(field) is not None:
+            REGISTRY.histogram("avatharam_viewer_seconds", "Viewer WebRTC RTT and jitter.",
+                               quantity=name).observe(stats[field] / 1000.0)
@@ -0,0 +1,84 @@
+# Hands-free voice turns: final transcript -> LLM -> avatar with no click.
+#
+# As soon as a transcript is final the reply is requested on a background
+# thread, speculatively, while the transcript is still on screen; each
+# sentence goes straight to the session's speech worker. Editing the text,
+# recording again or pressing ChatGPT cancels the turn, which closes the
+# OpenAI stream and silences anything the avatar already started saying.
+#
+# Environment:
+#   HANDS_FREE   "1" to start with hands-free turns on (also a sidebar toggle)
+
+import os
+import threading
+import time
+from typing import Optional
+
+from applog import debug
+from llm import LLM_CACHE, stream_reply
+from speech_queue import peek_worker, speak
+from tracing import count, run_in_context
+
+HANDS_FREE = os.getenv("HANDS_FREE", "0") == "1"
+
+
+class VoiceTurn:
+    def __init__(self, api_key: str, transcript: str, session_id: Optional[str] = None,
+                 session_token: Optional[str] = None, use_cache: bool = LLM_CACHE,
+                 history: Optional[list] = None):
+        self.transcript = transcript.strip()
+        self.session_id = session_id
+        self.session_token = session_token
+        self.reply: Optional[str] = None
+        self.timings: Optional[dict] = None
+        self.error: Optional[Exception] = None
+        self.spoken = 0
+        self.started_at = time.monotonic()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=run_in_context(self._run, api_key, use_cache, history),
+                                        name="voice-turn", daemon=True)
+        self._thread.start()
+
+    @property
+    def finished(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _speak(self, chunk: str):
+        self.spoken += 1
+        return speak(self.session_id, self.session_token, chunk)  # Future: times first_speech
+
+    def _run(self, api_key: str, use_cache: bool, history: Optional[list]):
+        on_sentence = self._speak if self.session_id and self.session_token else None
+        result = "ok"
+        try:
+            self.reply, self.timings = stream_reply(api_key, self.transcript, speak=on_sentence,
+                                                    use_cache=use_cache, cancel=self._cancel,
+                                                    history=history)
+            if self.timings.get("cancelled"):
+                result = "cancelled"
+        except Exception as e:
+            self.error = e
+            result = "cancelled" if self._cancel.is_set() else "error"
+            debug(f"[turn] failed: {repr(e)}")
+        finally:
+            count("avatharam_voice_turns_total", "Hands-free voice turns by outcome.", result=result)
+            self._done.set()
+
+    def cancel(self, reason: str = ""):
+        """Stop the turn; the avatar is interrupted if it already started speaking."""
+        if self._done.is_set() and self.spoken == 0:
+            return
+        self._cancel.set()
+        debug(f"[turn] cancelled ({reason}) after {time.monotonic() - self.started_at:.2f}s")
+        if self.spoken:
+            worker = peek_worker(self.session_id)
+            if worker is not None:
+                worker.interrupt()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)